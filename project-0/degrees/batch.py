@@ -0,0 +1,158 @@
+"""
+Answers many degrees-of-separation queries in one run.
+
+Reads CSV rows of source,target (person IDs or exact names) from a
+file, or from stdin if no file or "-" is given, and writes one CSV row
+per query as soon as it is answered:
+
+    source_id,target_id,degrees,path
+
+where path is a space-separated list of movie_id:person_id steps.
+Degrees is empty if the two people are not connected, and "unknown"
+if either person cannot be resolved.
+"""
+
+import csv
+import itertools
+import multiprocessing
+import sys
+
+import degrees
+
+# Number of input rows grouped together before they are dispatched
+CHUNK_SIZE = 1000
+
+
+def resolve(person):
+    """
+    Returns the person_id for an ID or an exact, unambiguous name,
+    or None if there is no such person.
+    """
+    if person in degrees.people:
+        return person
+    person_ids = degrees.names.get(person.lower(), set())
+    if len(person_ids) == 1:
+        return next(iter(person_ids))
+    return None
+
+
+def group_by_source(pairs):
+    """
+    Returns a list of (source, targets) groups for (source, target)
+    pairs, keeping the order in which each source first appears.
+    """
+    groups = {}
+    for source, target in pairs:
+        groups.setdefault(source, []).append(target)
+    return list(groups.items())
+
+
+def answer(group):
+    """
+    Answers every query of a (source, targets) group, using one
+    cached full search from the source when there are several
+    targets or the source is already in the worker's cache.
+
+    Returns a list of (source, target, path) tuples.
+    """
+    source, targets = group
+    if len(targets) == 1 and source not in degrees.tree_cache:
+        return [(source, targets[0],
+                 degrees.shortest_path(source, targets[0]))]
+    tree = degrees.cached_tree(source)
+    return [(source, target, degrees.path_in_tree(tree, target))
+            for target in targets]
+
+
+def init_worker(directory, cache_entries, cache_bytes):
+    """
+    Loads the data in a worker process, unless it was inherited
+    already loaded from the parent, and sizes its tree cache.
+    """
+    if not degrees.people:
+        degrees.load_data(directory, compact=True)
+    degrees.tree_cache.max_entries = cache_entries
+    degrees.tree_cache.max_bytes = cache_bytes
+
+
+def run(rows, directory, processes=None, chunk_size=CHUNK_SIZE,
+        cache_entries=None, cache_bytes=None):
+    """
+    Answers (source, target) rows using a pool of processes that
+    share the graph loaded from directory, yielding output rows as
+    they are ready.
+
+    Each process keeps its own tree cache limited to cache_entries
+    trees and cache_bytes bytes, or degrees.tree_cache's limits if
+    these are None.
+    """
+    if cache_entries is None:
+        cache_entries = degrees.tree_cache.max_entries
+    if cache_bytes is None:
+        cache_bytes = degrees.tree_cache.max_bytes
+    initargs = (directory, cache_entries, cache_bytes)
+    with multiprocessing.Pool(processes, init_worker, initargs) as pool:
+        rows = iter(rows)
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+
+            pairs = []
+            for row in chunk:
+                source = resolve(row[0].strip())
+                target = resolve(row[1].strip())
+                if source is None or target is None:
+                    yield [row[0], row[1], "unknown", ""]
+                else:
+                    pairs.append((source, target))
+
+            groups = group_by_source(pairs)
+            for results in pool.imap_unordered(answer, groups):
+                for source, target, path in results:
+                    if path is None:
+                        yield [source, target, "", ""]
+                    else:
+                        yield [source, target, len(path), " ".join(
+                            f"{movie_id}:{person_id}"
+                            for movie_id, person_id in path)]
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    flags = [arg for arg in sys.argv[1:] if arg.startswith("--")]
+    options = {"--processes": None, "--cache-entries": None,
+               "--cache-mb": None}
+    for flag in flags:
+        name, _, value = flag.partition("=")
+        if name not in options or not value.isdigit():
+            args = None
+            break
+        options[name] = int(value)
+    if args is None or len(args) > 2:
+        sys.exit("Usage: python batch.py [directory] [pairs] "
+                 "[--processes=N] [--cache-entries=N] [--cache-mb=N]")
+    cache_bytes = options["--cache-mb"]
+    if cache_bytes is not None:
+        cache_bytes *= 2 ** 20
+    directory = args[0] if len(args) >= 1 else "large"
+    filename = args[1] if len(args) == 2 else "-"
+
+    # Load once before the pool forks, so workers share the graph
+    print("Loading data...", file=sys.stderr)
+    degrees.load_data(directory, compact=True)
+    print("Data loaded.", file=sys.stderr)
+
+    f = sys.stdin if filename == "-" else open(filename, encoding="utf-8")
+    with f:
+        rows = (row for row in csv.reader(f) if len(row) == 2)
+        writer = csv.writer(sys.stdout)
+        for row in run(rows, directory, options["--processes"],
+                       cache_entries=options["--cache-entries"],
+                       cache_bytes=cache_bytes):
+            writer.writerow(row)
+            sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,14 @@
 import csv
+import itertools
+import os
 import sys
 
-from util import Node, StackFrontier, QueueFrontier
+import loader
+import snapshot as snapshots
+from graph import CompactGraph, CompactTree
+from landmarks import LandmarkIndex, landmarks_path
+from nameindex import NameIndex
+from util import Node, StackFrontier, QueueFrontier, LRUCache
 
 # Maps names to a set of corresponding person_ids
 names = {}
@@ -12,11 +19,75 @@ people = {}
 # Maps movie_ids to a dictionary of: title, year, stars (a set of person_ids)
 movies = {}
 
+# Compact integer-indexed graph, if loaded with compact=True
+graph = None
 
-def load_data(directory):
+# Landmark distances over the compact graph, if built by landmarks.py
+landmark_index = None
+
+# Prefix and fuzzy name index, built on the first failed lookup
+name_index = None
+
+# Counts the nodes expanded by the last search
+stats = {"expanded": 0}
+
+
+def tree_size(tree):
+    """
+    Returns the approximate number of bytes held by a
+    shortest_path_tree.
+    """
+    if isinstance(tree, CompactTree):
+        return tree.nbytes()
+    return sys.getsizeof(tree) + len(tree) * sys.getsizeof((None, None))
+
+
+# Maps hot source person_ids to their shortest_path_tree
+tree_cache = LRUCache(max_entries=32, max_bytes=256 * 2 ** 20,
+                      sizeof=tree_size)
+
+
+def load_data(directory, compact=False, snapshot=True, processes=None):
     """
     Load data from CSV files into memory.
+
+    If compact is True, the people <-> movies links are moved into
+    a CompactGraph and dropped from the people and movies dictionaries.
+
+    If snapshot is True and the directory has an up-to-date snapshot
+    (see snapshot.py), it is memory-mapped instead of parsing the CSV
+    files, which always loads the compact graph.
+
+    If processes is given, the CSV files are parsed straight into the
+    compact graph by that many processes (see loader.py); with 1,
+    stars.csv is streamed without keeping its rows.
+
+    With the compact graph, an up-to-date landmark index (see
+    landmarks.py) is loaded as well.
+
+    Any previously loaded data is replaced. From a snapshot or with
+    processes, people, movies and names are read-only views of the
+    mapped file or of the parsed columns.
     """
+    global graph, name_index, landmark_index, people, movies, names
+    name_index = None
+    landmark_index = None
+    use_snapshot = snapshot and snapshots.is_fresh(directory)
+    if use_snapshot or processes:
+        if use_snapshot:
+            graph, people, movies, names = snapshots.load_snapshot(
+                snapshots.snapshot_path(directory))
+        else:
+            graph, people, movies, names = loader.load_compact(
+                directory, processes)
+        tree_cache.clear()
+        use_landmarks(directory)
+        return
+
+    graph = None
+    people, movies, names = {}, {}, {}
+    tree_cache.clear()
+
     # Load people
     with open(f"{directory}/people.csv", encoding="utf-8") as f:
         reader = csv.DictReader(f)
@@ -51,16 +122,58 @@ def load_data(directory):
             except KeyError:
                 pass
 
+    if compact:
+        use_compact_graph()
+        use_landmarks(directory)
+
+
+def use_compact_graph():
+    """
+    Builds the compact graph from the loaded data and frees the
+    per-person and per-movie sets it replaces.
+    """
+    global graph
+    graph = CompactGraph.from_data(people, movies)
+    tree_cache.clear()
+    for person in people.values():
+        person["movies"] = None
+    for movie in movies.values():
+        movie["stars"] = None
+
+
+def use_landmarks(directory):
+    """
+    Memory-maps the landmark index of directory for the compact
+    graph if it exists and is up to date, or drops any previous one.
+    """
+    global landmark_index
+    landmark_index = None
+    path = landmarks_path(directory)
+    if snapshots.is_fresh(directory, path):
+        landmark_index = LandmarkIndex.load(path, graph)
+
 
 def main():
-    if len(sys.argv) > 2:
-        sys.exit("Usage: python degrees.py [directory]")
-    directory = sys.argv[1] if len(sys.argv) == 2 else "large"
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    flags = {arg for arg in sys.argv[1:] if arg.startswith("--")}
+    if len(args) > 1 or not flags <= {"--astar", "--bidirectional", "--compact",
+                                        "--parallel", "--stats"}:
+        sys.exit("Usage: python degrees.py [directory] [--astar] "
+                 "[--bidirectional] [--compact] [--parallel] [--stats]")
+    directory = args[0] if len(args) == 1 else "large"
 
     # Load data from files into memory
     print("Loading data...")
-    load_data(directory)
+    # The landmark index needs the compact graph, so --astar implies it
+    processes = os.cpu_count() if "--parallel" in flags else None
+    compact = "--compact" in flags or "--astar" in flags
+    load_data(directory, compact=compact, processes=processes)
     print("Data loaded.")
+    if "--astar" in flags and landmark_index is None:
+        if os.path.exists(landmarks_path(directory)):
+            sys.exit("Landmark index is out of date, run: "
+                     f"python landmarks.py {directory}")
+        sys.exit(f"No landmark index, run: python landmarks.py {directory}")
 
     source = person_id_for_name(input("Name: "))
     if source is None:
@@ -69,7 +182,12 @@ def main():
     if target is None:
         sys.exit("Person not found.")
 
-    path = shortest_path(source, target)
+    path = shortest_path(source, target,
+                         bidirectional="--bidirectional" in flags,
+                         astar="--astar" in flags)
+
+    if "--stats" in flags:
+        print(f"{stats['expanded']} nodes expanded.")
 
     if path is None:
         print("Not connected.")
@@ -84,13 +202,35 @@ def main():
             print(f"{i + 1}: {person1} and {person2} starred in {movie}")
 
 
-def shortest_path(source, target):
+def shortest_path(source, target, bidirectional=False, cache=False,
+                  astar=False):
     """
     Returns the shortest list of (movie_id, person_id) pairs
     that connect the source to the target.
 
+    If astar is True, the search is A* guided by the landmark index.
+    If cache is True, the path is read from the source's cached
+    shortest_path_tree, which is built on a miss (see cached_tree).
+    If bidirectional is True, the search grows from both ends
+    (see bidirectional_shortest_path). Otherwise, if the compact
+    graph is loaded, the search runs over its arrays.
+
     If no possible path, returns None.
     """
+    if astar:
+        if landmark_index is None:
+            raise Exception("landmark index not loaded")
+        path = landmark_index.shortest_path(source, target)
+        stats["expanded"] = landmark_index.expanded
+        return path
+    if cache:
+        return path_in_tree(cached_tree(source), target)
+    if bidirectional:
+        return bidirectional_shortest_path(source, target)
+    if graph is not None:
+        path = graph.shortest_path(source, target)
+        stats["expanded"] = graph.expanded
+        return path
 
     def build_solution(node):
         solution = []
@@ -108,9 +248,11 @@ def shortest_path(source, target):
     frontier = QueueFrontier()
     frontier.add(start)
     explored = set()
+    stats["expanded"] = 0
 
     while not frontier.empty():
         p = frontier.remove();
+        stats["expanded"] += 1
 
         if p.state == target:  # Solution found, build it
             return build_solution(p)
@@ -131,6 +273,213 @@ def shortest_path(source, target):
     return None
 
 
+def degrees_of_separation(source, target):
+    """
+    Returns the number of movies on a shortest path between
+    source and target, or None if they are not connected.
+
+    With the landmark index loaded, this needs no search when the
+    landmark bounds already agree.
+    """
+    if landmark_index is not None:
+        distance = landmark_index.degrees(source, target)
+        stats["expanded"] = landmark_index.expanded
+        return distance
+    path = shortest_path(source, target)
+    return None if path is None else len(path)
+
+
+def shortest_path_tree(source):
+    """
+    Runs a full breadth-first search from source.
+
+    Returns a dictionary mapping every person_id reachable from
+    source to the (movie_id, person_id) step from its parent on a
+    shortest path, and source to None.
+    """
+    if graph is not None:
+        tree = graph.shortest_path_tree(source)
+        stats["expanded"] = graph.expanded
+        return tree
+
+    tree = {source: None}
+    layer = [source]
+    stats["expanded"] = 0
+
+    while layer:
+        next_layer = []
+        for person_id in layer:
+            stats["expanded"] += 1
+            for movie_id, neighbor in neighbors_for_person(person_id):
+                if neighbor not in tree:
+                    tree[neighbor] = (movie_id, person_id)
+                    next_layer.append(neighbor)
+        layer = next_layer
+
+    return tree
+
+
+def cached_tree(source):
+    """
+    Returns the shortest_path_tree of source from tree_cache,
+    building and caching it on a miss.
+    """
+    tree = tree_cache.get(source)
+    if tree is None:
+        tree = shortest_path_tree(source)
+        tree_cache.put(source, tree)
+    else:
+        stats["expanded"] = 0
+    return tree
+
+
+def path_in_tree(tree, target):
+    """
+    Returns the list of (movie_id, person_id) pairs that connect
+    the source of a shortest_path_tree to the target.
+
+    If the target is not in the tree, returns None.
+    """
+    if target not in tree:
+        return None
+
+    solution = []
+    while tree[target] is not None:
+        movie_id, parent = tree[target]
+        solution.append((movie_id, target))
+        target = parent
+
+    solution.reverse()
+    return solution
+
+
+def all_shortest_paths(source, target, k=None):
+    """
+    Generates every shortest list of (movie_id, person_id) pairs
+    that connects the source to the target, or only the first k.
+
+    Paths are enumerated lazily from the BFS layer predecessors, so
+    only the current path is held however many paths there are.
+    Generates nothing if there is no possible path.
+    """
+    paths = enumerate_shortest_paths(source, target)
+    return paths if k is None else itertools.islice(paths, k)
+
+
+def enumerate_shortest_paths(source, target):
+    """Generator behind all_shortest_paths."""
+    # Maps each reached person_id to its depth and to the
+    # (movie_id, person_id) steps reaching it from the previous layer
+    depth = {source: 0}
+    predecessors = {source: []}
+    layer = [source]
+    stats["expanded"] = 0
+
+    while layer and target not in depth:
+        next_layer = []
+        for person_id in layer:
+            stats["expanded"] += 1
+            for movie_id, neighbor in neighbors_for_person(person_id):
+                if neighbor not in depth:
+                    depth[neighbor] = depth[person_id] + 1
+                    predecessors[neighbor] = []
+                    next_layer.append(neighbor)
+                if depth[neighbor] == depth[person_id] + 1:
+                    predecessors[neighbor].append((movie_id, person_id))
+        layer = next_layer
+
+    if target not in depth:
+        return
+
+    def walk(person_id, steps):
+        """Yields the paths to source ending with reversed steps."""
+        if person_id == source:
+            yield steps[::-1]
+            return
+        for movie_id, parent in predecessors[person_id]:
+            steps.append((movie_id, person_id))
+            yield from walk(parent, steps)
+            steps.pop()
+
+    yield from walk(target, [])
+
+
+def bidirectional_shortest_path(source, target):
+    """
+    Returns the shortest list of (movie_id, person_id) pairs
+    that connect the source to the target, growing one BFS from
+    the source and another from the target until they meet.
+
+    If no possible path, returns None.
+    """
+
+    def expand_layer(layer, reached, other):
+        """
+        Expands every person in layer, recording in reached the
+        (person_id, movie_id) step that leads back to its own end.
+        Returns the next layer and the best person where both
+        searches meet, if any.
+        """
+        next_layer = []
+        meeting = None
+        best = None
+        for person_id in layer:
+            stats["expanded"] += 1
+            depth = reached[person_id][2] + 1
+            for movie_id, neighbor in neighbors_for_person(person_id):
+                if neighbor in reached:
+                    continue
+                reached[neighbor] = (person_id, movie_id, depth)
+                next_layer.append(neighbor)
+                if neighbor in other:
+                    length = depth + other[neighbor][2]
+                    if best is None or length < best:
+                        best = length
+                        meeting = neighbor
+        return next_layer, meeting
+
+    def build_solution(meeting):
+        solution = []
+
+        person_id = meeting
+        while forward[person_id][0] is not None:
+            parent, movie_id, _ = forward[person_id]
+            solution.append((movie_id, person_id))
+            person_id = parent
+        solution.reverse()
+
+        person_id = meeting
+        while backward[person_id][0] is not None:
+            person_id, movie_id, _ = backward[person_id]
+            solution.append((movie_id, person_id))
+
+        return solution
+
+    stats["expanded"] = 0
+    if source == target:
+        return []
+
+    # Maps reached person_ids to (parent person_id, movie_id, depth)
+    forward = {source: (None, None, 0)}
+    backward = {target: (None, None, 0)}
+    forward_layer = [source]
+    backward_layer = [target]
+
+    # Always finish a whole layer of the smaller side, so the best
+    # meeting point in that layer gives a shortest path
+    while forward_layer and backward_layer:
+        if len(forward_layer) <= len(backward_layer):
+            forward_layer, meeting = expand_layer(
+                forward_layer, forward, backward)
+        else:
+            backward_layer, meeting = expand_layer(
+                backward_layer, backward, forward)
+        if meeting is not None:
+            return build_solution(meeting)
+
+    return None
+
+
 def person_id_for_name(name):
     """
     Returns the IMDB id for a person's name,
@@ -138,7 +487,7 @@ def person_id_for_name(name):
     """
     person_ids = list(names.get(name.lower(), set()))
     if len(person_ids) == 0:
-        return None
+        return person_id_for_candidates(name)
     elif len(person_ids) > 1:
         print(f"Which '{name}'?")
         for person_id in person_ids:
@@ -157,11 +506,34 @@ def person_id_for_name(name):
         return person_ids[0]
 
 
+def person_id_for_candidates(name):
+    """
+    Offers the closest names to an unknown name and returns the
+    IMDB id picked, or None if there is no close name.
+    """
+    global name_index
+    if name_index is None:
+        name_index = NameIndex(people)
+
+    candidates = name_index.search(name, limit=5)
+    if not candidates:
+        return None
+    print(f"No '{name}' found. Did you mean:")
+    for person_id, name, birth, _ in candidates:
+        print(f"ID: {person_id}, Name: {name}, Birth: {birth}")
+    person_id = input("Intended Person ID: ")
+    if person_id in {candidate[0] for candidate in candidates}:
+        return person_id
+    return None
+
+
 def neighbors_for_person(person_id):
     """
     Returns (movie_id, person_id) pairs for people
     who starred with a given person.
     """
+    if graph is not None:
+        return graph.neighbors(person_id)
     movie_ids = people[person_id]["movies"]
     neighbors = set()
     for movie_id in movie_ids:
@@ -0,0 +1,239 @@
+from array import array
+
+
+class CompactGraph():
+    """
+    Bipartite person <-> movie graph with IDs interned to dense
+    integers and adjacency stored in CSR-style arrays: the movies of
+    person i are person_movies[person_offsets[i]:person_offsets[i + 1]],
+    and likewise for the stars of each movie.
+
+    person_index and movie_index map IDs back to indices; they are
+    built from the ID lists unless given.
+    """
+
+    def __init__(self, person_ids, movie_ids,
+                 person_offsets, person_movies, movie_offsets, movie_stars,
+                 person_index=None, movie_index=None):
+        self.person_ids = person_ids
+        self.movie_ids = movie_ids
+        if person_index is None:
+            person_index = {pid: i for i, pid in enumerate(person_ids)}
+        if movie_index is None:
+            movie_index = {mid: i for i, mid in enumerate(movie_ids)}
+        self.person_index = person_index
+        self.movie_index = movie_index
+        self.person_offsets = person_offsets
+        self.person_movies = person_movies
+        self.movie_offsets = movie_offsets
+        self.movie_stars = movie_stars
+
+        # Number of people expanded by the last search
+        self.expanded = 0
+
+    @classmethod
+    def from_data(cls, people, movies):
+        """
+        Builds a compact graph from the people and movies dictionaries
+        filled by degrees.load_data.
+        """
+        person_ids = list(people)
+        movie_ids = list(movies)
+        person_index = {pid: i for i, pid in enumerate(person_ids)}
+        movie_index = {mid: i for i, mid in enumerate(movie_ids)}
+
+        person_offsets, person_movies = cls.build_csr(
+            [people[pid]["movies"] for pid in person_ids], movie_index)
+        movie_offsets, movie_stars = cls.build_csr(
+            [movies[mid]["stars"] for mid in movie_ids], person_index)
+
+        return cls(person_ids, movie_ids,
+                   person_offsets, person_movies, movie_offsets, movie_stars,
+                   person_index, movie_index)
+
+    @classmethod
+    def from_edges(cls, person_ids, movie_ids, edge_people, edge_movies):
+        """
+        Builds a compact graph from interned IDs and two parallel
+        arrays holding the person and movie index of each star.
+        Repeated stars are kept only once.
+        """
+        person_offsets, person_movies = cls.group_edges(
+            len(person_ids), edge_people, edge_movies)
+        movie_offsets, movie_stars = cls.group_edges(
+            len(movie_ids), edge_movies, edge_people)
+        return cls(person_ids, movie_ids,
+                   person_offsets, person_movies, movie_offsets, movie_stars)
+
+    @staticmethod
+    def group_edges(n, sources, targets, base=0):
+        """
+        Returns the (offsets, targets) arrays grouping the edges
+        sources[k] -> targets[k] by source index in range(base,
+        base + n), with each group's targets sorted and unique.
+        """
+        buckets = [[] for _ in range(n)]
+        for source, target in zip(sources, targets):
+            buckets[source - base].append(target)
+
+        offsets = array("i", [0])
+        grouped = array("i")
+        for bucket in buckets:
+            grouped.extend(sorted(set(bucket)))
+            offsets.append(len(grouped))
+        return offsets, grouped
+
+    @staticmethod
+    def build_csr(adjacency, index):
+        """
+        Returns the (offsets, targets) arrays for a list of sets of
+        string IDs, translating each ID through index.
+        """
+        offsets = array("i", [0])
+        targets = array("i")
+        for ids in adjacency:
+            targets.extend(sorted(index[i] for i in ids))
+            offsets.append(len(targets))
+        return offsets, targets
+
+    def movies_for(self, p):
+        """Returns the movie indices of person index p."""
+        return self.person_movies[
+            self.person_offsets[p]:self.person_offsets[p + 1]]
+
+    def stars_for(self, m):
+        """Returns the person indices of movie index m."""
+        return self.movie_stars[
+            self.movie_offsets[m]:self.movie_offsets[m + 1]]
+
+    def neighbors(self, person_id):
+        """
+        Returns (movie_id, person_id) pairs for people
+        who starred with a given person.
+        """
+        neighbors = set()
+        for m in self.movies_for(self.person_index[person_id]):
+            movie_id = self.movie_ids[m]
+            for q in self.stars_for(m):
+                neighbors.add((movie_id, self.person_ids[q]))
+        return neighbors
+
+    def shortest_path(self, source, target):
+        """
+        Returns the shortest list of (movie_id, person_id) pairs
+        that connect the source to the target, searching directly
+        over the adjacency arrays.
+
+        If no possible path, returns None.
+        """
+        s = self.person_index[source]
+        t = self.person_index[target]
+        parent, via = self.breadth_first(s, t)
+        if parent[t] == -1:
+            return None
+        return self.build_path(parent, via, s, t)
+
+    def shortest_path_tree(self, source):
+        """
+        Runs a full breadth-first search from source and returns
+        its shortest-path tree as a CompactTree.
+        """
+        s = self.person_index[source]
+        parent, via = self.breadth_first(s)
+        return CompactTree(self, s, parent, via)
+
+    def breadth_first(self, s, t=-1):
+        """
+        Searches from person index s until person index t is reached,
+        or the whole component if t is -1.
+
+        Returns the (parent, via) arrays holding, for each reached
+        person index, its parent person index and connecting movie
+        index. Unreached people have parent -1; s is its own parent.
+        """
+        self.expanded = 0
+
+        parent = array("i", [-1]) * len(self.person_ids)
+        via = array("i", [-1]) * len(self.person_ids)
+        parent[s] = s
+        if s == t:
+            return parent, via
+
+        # A movie only needs to be expanded the first time it is reached
+        seen_movie = bytearray(len(self.movie_ids))
+
+        person_offsets = self.person_offsets
+        person_movies = self.person_movies
+        movie_offsets = self.movie_offsets
+        movie_stars = self.movie_stars
+
+        layer = [s]
+        while layer:
+            next_layer = []
+            for p in layer:
+                self.expanded += 1
+                for k in range(person_offsets[p], person_offsets[p + 1]):
+                    m = person_movies[k]
+                    if seen_movie[m]:
+                        continue
+                    seen_movie[m] = 1
+                    for r in range(movie_offsets[m], movie_offsets[m + 1]):
+                        q = movie_stars[r]
+                        if parent[q] != -1:
+                            continue
+                        parent[q] = p
+                        via[q] = m
+                        if q == t:
+                            return parent, via
+                        next_layer.append(q)
+            layer = next_layer
+
+        return parent, via
+
+    def build_path(self, parent, via, s, t):
+        """
+        Follows parent links from t back to s and returns the
+        (movie_id, person_id) pairs in order from s.
+        """
+        solution = []
+        q = t
+        while q != s:
+            solution.append((self.movie_ids[via[q]], self.person_ids[q]))
+            q = parent[q]
+        solution.reverse()
+        return solution
+
+
+class CompactTree():
+    """
+    Shortest-path tree from one source over a CompactGraph.
+
+    Behaves like the dictionaries returned by
+    degrees.shortest_path_tree: it maps each reached person_id to
+    the (movie_id, parent person_id) step that reaches it, and the
+    source to None.
+    """
+
+    def __init__(self, graph, s, parent, via):
+        self.graph = graph
+        self.s = s
+        self.parent = parent
+        self.via = via
+
+    def nbytes(self):
+        """Returns the number of bytes held by the tree's arrays."""
+        return (self.parent.itemsize * len(self.parent)
+                + self.via.itemsize * len(self.via))
+
+    def __contains__(self, person_id):
+        p = self.graph.person_index.get(person_id)
+        return p is not None and self.parent[p] != -1
+
+    def __getitem__(self, person_id):
+        p = self.graph.person_index[person_id]
+        if self.parent[p] == -1:
+            raise KeyError(person_id)
+        if p == self.s:
+            return None
+        return (self.graph.movie_ids[self.via[p]],
+                self.graph.person_ids[self.parent[p]])
@@ -0,0 +1,296 @@
+"""
+Landmark distance index for the compact degrees graph.
+
+The index stores the degrees of separation from K landmark people
+to everyone else. By the triangle inequality, for any landmark L,
+
+    |d(L, s) - d(L, t)| <= d(s, t) <= d(L, s) + d(L, t)
+
+which bounds distances without searching and gives A* a heuristic
+(the ALT algorithm). Build the index once with:
+
+    python landmarks.py [directory] [k]
+"""
+
+import heapq
+import mmap
+import os
+import struct
+import sys
+from array import array
+
+FILENAME = "degrees.landmarks"
+MAGIC = b"DEGLMRK1"
+HEADER = struct.Struct("<8sII")
+
+# Distance stored for people a landmark cannot reach
+UNREACHABLE = -1
+
+
+def landmarks_path(directory):
+    """Returns the landmark index filename for a dataset directory."""
+    return os.path.join(directory, FILENAME)
+
+
+def distances_from(graph, s):
+    """
+    Returns an array with the degrees of separation from person
+    index s to every person index of graph, or UNREACHABLE.
+    """
+    distance = array("h", [UNREACHABLE]) * len(graph.person_ids)
+    distance[s] = 0
+    seen_movie = bytearray(len(graph.movie_ids))
+
+    layer = [s]
+    depth = 0
+    while layer:
+        depth += 1
+        next_layer = []
+        for p in layer:
+            for m in graph.movies_for(p):
+                if seen_movie[m]:
+                    continue
+                seen_movie[m] = 1
+                for q in graph.stars_for(m):
+                    if distance[q] == UNREACHABLE:
+                        distance[q] = depth
+                        next_layer.append(q)
+        layer = next_layer
+
+    return distance
+
+
+class LandmarkIndex():
+    """
+    Degrees of separation from each of a few landmark person
+    indices to every person index of a CompactGraph.
+    """
+
+    def __init__(self, graph, landmarks, distances):
+        self.graph = graph
+        self.landmarks = landmarks
+        self.distances = distances
+
+        # Number of people expanded by the last search
+        self.expanded = 0
+
+    @classmethod
+    def build(cls, graph, k):
+        """
+        Picks k landmarks and computes their distances.
+
+        The first landmark is the person in the most movies; each
+        following one is the person farthest from all landmarks
+        chosen so far, which spreads them over the graph.
+        """
+        n = len(graph.person_ids)
+        offsets = graph.person_offsets
+        landmarks = []
+        distances = []
+        if n == 0:
+            return cls(graph, landmarks, distances)
+
+        # Distance from each person to its nearest landmark so far
+        nearest = array("h", [UNREACHABLE]) * n
+        chosen = set()
+        landmark = max(range(n), key=lambda p: offsets[p + 1] - offsets[p])
+        while True:
+            landmarks.append(landmark)
+            chosen.add(landmark)
+            distance = distances_from(graph, landmark)
+            distances.append(distance)
+            if len(landmarks) == min(k, n):
+                break
+
+            for p in range(n):
+                d = distance[p]
+                if d != UNREACHABLE and (
+                        nearest[p] == UNREACHABLE or d < nearest[p]):
+                    nearest[p] = d
+
+            # People no landmark reaches yet count as farthest away,
+            # so every component eventually gets a landmark
+            landmark = max(
+                (p for p in range(n) if p not in chosen),
+                key=lambda p: (nearest[p] == UNREACHABLE, nearest[p]))
+
+        return cls(graph, landmarks, distances)
+
+    def save(self, path):
+        """Writes the landmarks and their distances to path."""
+        n = len(self.graph.person_ids)
+        tmp = f"{path}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(HEADER.pack(MAGIC, len(self.landmarks), n))
+            values = array("i", self.landmarks)
+            if sys.byteorder == "big":
+                values.byteswap()
+            f.write(values.tobytes())
+            # Pad so the int16 distances start 8-byte aligned
+            f.write(b"\0" * (-f.tell() % 8))
+            for distance in self.distances:
+                values = array("h", distance)
+                if sys.byteorder == "big":
+                    values.byteswap()
+                f.write(values.tobytes())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path, graph):
+        """
+        Memory-maps the index at path for graph.
+
+        Raises ValueError if the file is not a landmark index for
+        a graph of this size.
+        """
+        with open(path, "rb") as f:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, k, n = HEADER.unpack_from(buffer)
+        if magic != MAGIC or n != len(graph.person_ids):
+            raise ValueError(f"{path} is not a landmark index for this data")
+
+        view = memoryview(buffer)
+        start = HEADER.size
+        landmarks = array("i", view[start:start + 4 * k].tobytes())
+        if sys.byteorder == "big":
+            landmarks.byteswap()
+        landmarks = list(landmarks)
+
+        start += 4 * k
+        start += -start % 8
+        distances = []
+        for _ in range(k):
+            chunk = view[start:start + 2 * n]
+            if sys.byteorder == "big":
+                distance = array("h", chunk.tobytes())
+                distance.byteswap()
+            else:
+                distance = chunk.cast("h")
+            distances.append(distance)
+            start += 2 * n
+
+        index = cls(graph, landmarks, distances)
+        # The distance arrays borrow from the mapping, so keep it alive
+        index.buffer = buffer
+        return index
+
+    def bounds(self, s, t):
+        """
+        Returns (lower, upper) bounds on the degrees of separation
+        between person indices s and t. Upper is None if no landmark
+        reaches both; lower is None if they cannot be connected.
+        """
+        lower = 0
+        upper = None
+        for distance in self.distances:
+            ds, dt = distance[s], distance[t]
+            if (ds == UNREACHABLE) != (dt == UNREACHABLE):
+                return None, None
+            if ds == UNREACHABLE:
+                continue
+            lower = max(lower, abs(ds - dt))
+            if upper is None or ds + dt < upper:
+                upper = ds + dt
+        return lower, upper
+
+    def degrees(self, source, target):
+        """
+        Returns the degrees of separation between two person_ids,
+        or None if they are not connected.
+
+        Answers from the landmark bounds alone when they meet, and
+        falls back to an A* search otherwise.
+        """
+        graph = self.graph
+        s = graph.person_index[source]
+        t = graph.person_index[target]
+        if s == t:
+            return 0
+        lower, upper = self.bounds(s, t)
+        if lower is None:
+            return None
+        if lower == upper:
+            self.expanded = 0
+            return lower
+        path = self.shortest_path(source, target)
+        return None if path is None else len(path)
+
+    def shortest_path(self, source, target):
+        """
+        Returns the shortest list of (movie_id, person_id) pairs
+        that connect the source to the target, found by A* with
+        the landmark lower bounds as heuristic.
+
+        If no possible path, returns None.
+        """
+        graph = self.graph
+        s = graph.person_index[source]
+        t = graph.person_index[target]
+        self.expanded = 0
+        if s == t:
+            return []
+        if self.bounds(s, t)[0] is None:
+            return None
+
+        # Distances to t from each landmark, and its reachability
+        targets = [(distance, distance[t]) for distance in self.distances]
+
+        def heuristic(p):
+            h = 0
+            for distance, dt in targets:
+                dp = distance[p]
+                if dp == UNREACHABLE or dt == UNREACHABLE:
+                    continue
+                h = max(h, abs(dp - dt))
+            return h
+
+        n = len(graph.person_ids)
+        cost = array("i", [-1]) * n
+        parent = array("i", [-1]) * n
+        via = array("i", [-1]) * n
+        closed = bytearray(n)
+        cost[s] = 0
+        parent[s] = s
+
+        frontier = [(heuristic(s), 0, s)]
+        while frontier:
+            _, g, p = heapq.heappop(frontier)
+            if closed[p]:
+                continue
+            closed[p] = 1
+            if p == t:
+                return graph.build_path(parent, via, s, t)
+            self.expanded += 1
+
+            for m in graph.movies_for(p):
+                for q in graph.stars_for(m):
+                    if closed[q] or (cost[q] != -1 and cost[q] <= g + 1):
+                        continue
+                    cost[q] = g + 1
+                    parent[q] = p
+                    via[q] = m
+                    heapq.heappush(frontier, (g + 1 + heuristic(q), g + 1, q))
+
+        return None
+
+
+def main():
+    if len(sys.argv) > 3:
+        sys.exit("Usage: python landmarks.py [directory] [k]")
+    directory = sys.argv[1] if len(sys.argv) >= 2 else "large"
+    k = int(sys.argv[2]) if len(sys.argv) == 3 else 16
+
+    import degrees
+
+    print("Loading data...")
+    degrees.load_data(directory, compact=True)
+    print(f"Computing distances from {k} landmarks...")
+    index = LandmarkIndex.build(degrees.graph, k)
+    path = landmarks_path(directory)
+    index.save(path)
+    print(f"Landmark index written to {path}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,363 @@
+"""
+Parallel loader for the degrees CSV files.
+
+Each CSV file is split into byte ranges that are parsed by a pool of
+processes, which return their rows column by column. People and
+movies are interned to dense indices in file order. Each chunk of
+stars.csv comes back as int32 arrays of person and movie indices,
+already split by ranges of people and ranges of movies, and a second
+round groups each range into its slice of the CompactGraph arrays.
+The names index is built the same way, one partition of the names
+per worker.
+
+The parent process only joins lists and arrays end to end and builds
+the ID -> index dictionaries, so nearly all of the work is spread
+over the pool. Forked workers inherit those dictionaries; they are
+pickled to each worker only where processes are spawned.
+
+Chunks are split at newlines, so quoted fields must not span lines.
+"""
+
+import contextlib
+import csv
+import itertools
+import multiprocessing
+import os
+import zlib
+from array import array
+from bisect import bisect_left
+from collections.abc import Mapping
+
+from graph import CompactGraph
+from snapshot import Records
+
+# Smallest byte range given to a single worker
+MIN_CHUNK_SIZE = 2 ** 20
+
+# ID -> index maps used by workers to intern the stars they parse
+person_index = {}
+movie_index = {}
+
+
+def byte_ranges(filename, chunks):
+    """
+    Returns up to chunks (start, end) byte ranges covering filename.
+    A line belongs to the range in which it starts.
+    """
+    size = os.path.getsize(filename)
+    chunks = max(1, min(chunks, size // MIN_CHUNK_SIZE))
+    bounds = [size * k // chunks for k in range(chunks + 1)]
+    return list(zip(bounds, bounds[1:]))
+
+
+def index_ranges(n, ranges):
+    """
+    Returns the ranges + 1 bounds splitting range(n) into ranges
+    parts, where index i falls in part i * ranges // n.
+    """
+    return [-(-n * r // ranges) for r in range(ranges + 1)]
+
+
+def name_partition(key, partitions):
+    """Returns the partition of the names index holding key."""
+    return zlib.crc32(key.encode("utf-8")) % partitions
+
+
+def read_lines(filename, start, end):
+    """
+    Yields the decoded lines of filename that start within
+    [start, end), skipping the header line.
+    """
+    with open(filename, "rb") as f:
+        if start == 0:
+            f.readline()
+        else:
+            # Finish the line running into start, unless start begins one
+            f.seek(start - 1)
+            f.readline()
+        while f.tell() < end:
+            line = f.readline()
+            if not line:
+                break
+            yield line.decode("utf-8")
+
+
+def parse_columns(filename, start, end, partitions=None):
+    """
+    Parses a byte range of people.csv or movies.csv.
+
+    Returns (ids, first, second, names): the id, name or title and
+    birth or year of each row as three lists, and, if partitions is
+    given, a (lowercased names, ids) pair of lists per partition of
+    the names index (None otherwise).
+    """
+    ids = []
+    first = []
+    second = []
+    for row in csv.reader(read_lines(filename, start, end)):
+        if len(row) == 3:
+            ids.append(row[0])
+            first.append(row[1])
+            second.append(row[2])
+    if partitions is None:
+        return ids, first, second, None
+
+    names = [([], []) for _ in range(partitions)]
+    for pid, name in zip(ids, first):
+        key = name.lower()
+        keys, person_ids = names[name_partition(key, partitions)]
+        keys.append(key)
+        person_ids.append(pid)
+    return ids, first, second, names
+
+
+def parse_stars(filename, start, end, ranges):
+    """
+    Parses a byte range of stars.csv, interning IDs as it goes
+    and skipping stars of unknown people or movies.
+
+    Returns (by_person, by_movie) lists of ranges pieces each:
+    by_person[r] holds the person and movie indices of the stars
+    whose person falls in part r of index_ranges, and by_movie[r]
+    the movie and person indices of those whose movie does, each
+    as two int32 arrays serialized to bytes.
+    """
+    people = len(person_index)
+    movies = len(movie_index)
+    by_person = [(array("i"), array("i")) for _ in range(ranges)]
+    by_movie = [(array("i"), array("i")) for _ in range(ranges)]
+    for row in csv.reader(read_lines(filename, start, end)):
+        if len(row) != 2:
+            continue
+        p = person_index.get(row[0])
+        m = movie_index.get(row[1])
+        if p is None or m is None:
+            continue
+        sources, targets = by_person[p * ranges // people]
+        sources.append(p)
+        targets.append(m)
+        sources, targets = by_movie[m * ranges // movies]
+        sources.append(m)
+        targets.append(p)
+    return ([(s.tobytes(), t.tobytes()) for s, t in by_person],
+            [(s.tobytes(), t.tobytes()) for s, t in by_movie])
+
+
+def group_range(start, end, pieces):
+    """
+    Groups the edges of (sources, targets) pieces, whose sources all
+    lie in range(start, end), by source.
+
+    Returns that range's slice of the (offsets, targets) arrays of
+    CompactGraph.group_edges, with offsets counted from 0, serialized
+    to bytes.
+    """
+    sources = array("i")
+    targets = array("i")
+    for piece_sources, piece_targets in pieces:
+        sources.frombytes(piece_sources)
+        targets.frombytes(piece_targets)
+    offsets, grouped = CompactGraph.group_edges(
+        end - start, sources, targets, start)
+    return offsets.tobytes(), grouped.tobytes()
+
+
+def join_groups(groups):
+    """
+    Joins the (offsets, targets) slices of group_range for
+    consecutive ranges into whole arrays.
+    """
+    offsets = array("i", [0])
+    targets = array("i")
+    for piece_offsets, piece_targets in groups:
+        base = len(targets)
+        piece = array("i")
+        piece.frombytes(piece_offsets)
+        offsets.extend(base + offset for offset in piece[1:])
+        targets.frombytes(piece_targets)
+    return offsets, targets
+
+
+def group_names(pieces):
+    """
+    Groups the (keys, person_ids) pieces of one partition of the
+    names index by key.
+
+    Returns (keys, offsets, person_ids) where keys are the sorted
+    distinct keys and key k names the people in
+    person_ids[offsets[k]:offsets[k + 1]].
+    """
+    pairs = sorted(itertools.chain.from_iterable(
+        zip(keys, person_ids) for keys, person_ids in pieces))
+    keys = []
+    offsets = array("i", [0])
+    person_ids = []
+    for key, pid in pairs:
+        if keys and keys[-1] != key:
+            offsets.append(len(person_ids))
+        if not keys or keys[-1] != key:
+            keys.append(key)
+        person_ids.append(pid)
+    if keys:
+        offsets.append(len(person_ids))
+    return keys, offsets, person_ids
+
+
+class NameGroups(Mapping):
+    """
+    Read-only dictionary mapping lowercased names to the set of
+    person_ids with that name, kept as the partitions built by
+    group_names.
+    """
+
+    def __init__(self, partitions):
+        self.partitions = partitions
+
+    def __len__(self):
+        return sum(len(keys) for keys, _, _ in self.partitions)
+
+    def __iter__(self):
+        for keys, _, _ in self.partitions:
+            yield from keys
+
+    def __getitem__(self, key):
+        if not isinstance(key, str):
+            raise KeyError(key)
+        keys, offsets, person_ids = self.partitions[
+            name_partition(key, len(self.partitions))]
+        k = bisect_left(keys, key)
+        if k == len(keys) or keys[k] != key:
+            raise KeyError(key)
+        return set(person_ids[offsets[k]:offsets[k + 1]])
+
+
+def set_indexes(people, movies):
+    """Pool initializer sharing the ID -> index maps with a worker."""
+    global person_index, movie_index
+    person_index = people
+    movie_index = movies
+
+
+@contextlib.contextmanager
+def worker_pool(processes, people=None, movies=None):
+    """
+    Yields a starmap function running jobs over a pool of processes,
+    or in this process if processes is 1, where the ID -> index maps
+    people and movies are set in every worker.
+    """
+    set_indexes(people or {}, movies or {})
+    try:
+        if processes == 1:
+            yield lambda function, jobs: list(
+                itertools.starmap(function, jobs))
+        elif multiprocessing.get_start_method() == "fork":
+            # Forked workers inherit the maps without pickling them
+            with multiprocessing.Pool(processes) as pool:
+                yield pool.starmap
+        else:
+            with multiprocessing.Pool(processes, set_indexes,
+                                      (people, movies)) as pool:
+                yield pool.starmap
+    finally:
+        set_indexes({}, {})
+
+
+def join_columns(chunks):
+    """Joins the columns parsed from consecutive chunks of a file."""
+    ids = []
+    first = []
+    second = []
+    for chunk_ids, chunk_first, chunk_second, _ in chunks:
+        ids.extend(chunk_ids)
+        first.extend(chunk_first)
+        second.extend(chunk_second)
+    return ids, first, second
+
+
+def intern(ids, *columns):
+    """
+    Returns (ids, index, columns) for parsed columns, where ids lists
+    each distinct ID once in file order, index maps it back to its
+    position and columns keep the last row of each ID.
+    """
+    index = dict(zip(ids, range(len(ids))))
+    if len(index) < len(ids):
+        # Repeated IDs: index holds the position of each one's last row
+        last = index
+        ids = list(dict.fromkeys(ids))
+        columns = [[column[last[i]] for i in ids] for column in columns]
+        index = dict(zip(ids, range(len(ids))))
+    return ids, index, columns
+
+
+def load_compact(directory, processes=None):
+    """
+    Loads directory straight into a compact graph.
+
+    With processes=1 every step runs in this process. Otherwise each
+    file is parsed in chunks, and the graph arrays and names index
+    built in parts, by a pool of that many processes (all CPUs if
+    None).
+
+    Returns a tuple (graph, people, movies, names) shaped like
+    snapshot.load_snapshot's, with people, movies and names as
+    read-only views of the parsed columns.
+    """
+    if processes is None:
+        processes = os.cpu_count() or 1
+    people_csv = os.path.join(directory, "people.csv")
+    movies_csv = os.path.join(directory, "movies.csv")
+    stars_csv = os.path.join(directory, "stars.csv")
+
+    with worker_pool(processes) as starmap:
+        person_chunks = starmap(parse_columns, [
+            (people_csv, start, end, processes)
+            for start, end in byte_ranges(people_csv, processes)
+        ])
+        movie_chunks = starmap(parse_columns, [
+            (movies_csv, start, end)
+            for start, end in byte_ranges(movies_csv, processes)
+        ])
+
+    person_ids, people_index, (person_names, births) = intern(
+        *join_columns(person_chunks))
+    movie_ids, movies_index, (titles, years) = intern(
+        *join_columns(movie_chunks))
+
+    # The names were split up as parsed, so only rebuild them if a
+    # repeated ID may have changed a person's name
+    if len(person_ids) == sum(len(chunk[0]) for chunk in person_chunks):
+        name_pieces = [[chunk[3][r] for chunk in person_chunks]
+                       for r in range(processes)]
+    else:
+        name_pieces = [[([name.lower() for name in person_names],
+                         person_ids)]]
+
+    person_bounds = index_ranges(len(person_ids), processes)
+    movie_bounds = index_ranges(len(movie_ids), processes)
+    with worker_pool(processes, people_index, movies_index) as starmap:
+        star_chunks = starmap(parse_stars, [
+            (stars_csv, start, end, processes)
+            for start, end in byte_ranges(stars_csv, processes)
+        ])
+        person_groups = starmap(group_range, [
+            (person_bounds[r], person_bounds[r + 1],
+             [chunk[0][r] for chunk in star_chunks])
+            for r in range(processes)
+        ])
+        movie_groups = starmap(group_range, [
+            (movie_bounds[r], movie_bounds[r + 1],
+             [chunk[1][r] for chunk in star_chunks])
+            for r in range(processes)
+        ])
+        name_partitions = starmap(
+            group_names, [(pieces,) for pieces in name_pieces])
+
+    graph = CompactGraph(person_ids, movie_ids,
+                         *join_groups(person_groups),
+                         *join_groups(movie_groups),
+                         people_index, movies_index)
+    people = Records(people_index,
+                     {"name": person_names, "birth": births}, "movies")
+    movies = Records(movies_index, {"title": titles, "year": years}, "stars")
+    return graph, people, movies, NameGroups(name_partitions)
@@ -0,0 +1,132 @@
+"""
+Name index supporting prefix and fuzzy lookups of people.
+
+Names are normalized (accents stripped, lowercased, whitespace
+collapsed) and kept in one sorted list. Prefix lookups are two binary
+searches; fuzzy lookups walk the sorted list like a trie, reusing the
+edit-distance rows of the prefix shared with the previous name and
+skipping every name below a prefix that is already too far away.
+"""
+
+import heapq
+import unicodedata
+from bisect import bisect_left
+
+
+def normalize(name):
+    """Returns name without accents, lowercased and single-spaced."""
+    decomposed = unicodedata.normalize("NFKD", name)
+    stripped = "".join(c for c in decomposed if not unicodedata.combining(c))
+    return " ".join(stripped.lower().split())
+
+
+def prefix_end(prefix):
+    """Returns the smallest string greater than all strings with prefix."""
+    return prefix[:-1] + chr(ord(prefix[-1]) + 1)
+
+
+class NameIndex():
+    """
+    Sorted index over the normalized names of people, as filled by
+    degrees.load_data.
+    """
+
+    def __init__(self, people):
+        self.people = people
+        ids_by_key = {}
+        for person_id, person in people.items():
+            key = normalize(person["name"])
+            ids_by_key.setdefault(key, []).append(person_id)
+        self.keys = sorted(ids_by_key)
+        self.ids = [ids_by_key[key] for key in self.keys]
+
+    def candidates(self, matches):
+        """
+        Returns (person_id, name, birth, distance) tuples for
+        (distance, key index) matches, ranked by distance, name
+        and birth year.
+        """
+        results = []
+        for distance, k in matches:
+            for person_id in self.ids[k]:
+                person = self.people[person_id]
+                results.append(
+                    (person_id, person["name"], person["birth"], distance))
+        results.sort(key=lambda c: (c[3], c[1], c[2]))
+        return results
+
+    def prefix(self, query, limit=10):
+        """
+        Returns up to limit candidates whose normalized name starts
+        with the normalized query. Their distance is the number of
+        characters the query is missing, so exact matches come first.
+        """
+        query = normalize(query)
+        if not query:
+            return []
+        start = bisect_left(self.keys, query)
+        end = bisect_left(self.keys, prefix_end(query), start)
+        # Rank every key with the prefix before keeping the closest,
+        # as the shortest names need not sort first
+        matches = heapq.nsmallest(
+            limit, ((len(self.keys[k]) - len(query), k)
+                    for k in range(start, end)))
+        return self.candidates(matches)[:limit]
+
+    def fuzzy(self, query, max_distance=2, limit=10):
+        """
+        Returns up to limit candidates whose normalized name is
+        within max_distance edits (Levenshtein) of the normalized
+        query, closest first.
+        """
+        query = normalize(query)
+        keys = self.keys
+        matches = []
+
+        # rows[d] is the edit-distance row of the first d characters
+        # of previous against the query
+        rows = [list(range(len(query) + 1))]
+        previous = ""
+        k = 0
+        while k < len(keys):
+            key = keys[k]
+            shared = 0
+            limit_shared = min(len(previous), len(key), len(rows) - 1)
+            while shared < limit_shared and previous[shared] == key[shared]:
+                shared += 1
+            del rows[shared + 1:]
+
+            for depth in range(shared, len(key)):
+                row = rows[-1]
+                c = key[depth]
+                new = [row[0] + 1]
+                for j in range(1, len(query) + 1):
+                    new.append(min(new[j - 1] + 1, row[j] + 1,
+                                   row[j - 1] + (query[j - 1] != c)))
+                rows.append(new)
+                if min(new) > max_distance:
+                    # No name with this prefix can get any closer
+                    previous = key[:depth + 1]
+                    k = bisect_left(keys, prefix_end(previous), k)
+                    break
+            else:
+                if rows[-1][-1] <= max_distance:
+                    matches.append((rows[-1][-1], k))
+                previous = key
+                k += 1
+
+        return self.candidates(matches)[:limit]
+
+    def search(self, query, max_distance=2, limit=10):
+        """
+        Returns up to limit ranked candidates for query: exact and
+        prefix matches first, then fuzzy matches.
+        """
+        results = self.prefix(query, limit)
+        seen = {c[0] for c in results}
+        for c in self.fuzzy(query, max_distance, limit):
+            if len(results) >= limit:
+                break
+            if c[0] not in seen:
+                results.append(c)
+        return results
@@ -0,0 +1,340 @@
+"""
+Binary snapshot of the degrees dataset.
+
+A snapshot holds the interned IDs, the compact graph arrays and the
+name index of a dataset directory, so later runs can memory-map it
+instead of parsing the CSV files again. Build one with:
+
+    python snapshot.py [directory]
+
+Loading decodes nothing up front: IDs, names and titles stay in the
+mapping as string tables, people and movies are found by binary
+search over sections listing them in ID order, and the dictionaries
+load_snapshot returns build each record only when it is looked up.
+Processes that load the same snapshot share all of its pages.
+"""
+
+import mmap
+import os
+import struct
+import sys
+from array import array
+from collections.abc import Mapping, Sequence
+
+from graph import CompactGraph
+
+FILENAME = "degrees.snapshot"
+MAGIC = b"DEGSNAP2"
+
+# Sections in file order; "s" sections are string tables, stored as
+# the UTF-8 strings end to end followed by an int32 array of the
+# offsets where each one starts (and where the last one ends), and
+# "i" sections are int32 arrays
+SECTIONS = [
+    ("person_ids", "s"),
+    ("person_names", "s"),
+    ("person_births", "s"),
+    ("movie_ids", "s"),
+    ("movie_titles", "s"),
+    ("movie_years", "s"),
+    ("person_offsets", "i"),
+    ("person_movies", "i"),
+    ("movie_offsets", "i"),
+    ("movie_stars", "i"),
+    ("name_keys", "s"),
+    ("name_offsets", "i"),
+    ("name_people", "i"),
+    ("person_order", "i"),
+    ("movie_order", "i"),
+]
+
+# Offset and length of each stored array, two per string table
+BLOBS = sum(2 if kind == "s" else 1 for _, kind in SECTIONS)
+HEADER = struct.Struct(f"<8s{2 * BLOBS}Q")
+
+
+class StringTable(Sequence):
+    """
+    Read-only list of the strings of a string table section, each
+    decoded from the mapping only when it is accessed.
+    """
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def raw(self, i):
+        """Returns the UTF-8 bytes of string i."""
+        return bytes(self.data[self.offsets[i]:self.offsets[i + 1]])
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("string table index out of range")
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]], "utf-8")
+
+
+class SortedIndex(Mapping):
+    """
+    Read-only dictionary mapping each string of a StringTable to its
+    position, found by binary search over order, the positions in
+    string order (or over the table itself if it is sorted and order
+    is None).
+    """
+
+    def __init__(self, table, order=None):
+        self.table = table
+        self.order = order
+
+    def __len__(self):
+        return len(self.table)
+
+    def __iter__(self):
+        return iter(self.table)
+
+    def __getitem__(self, key):
+        if not isinstance(key, str):
+            raise KeyError(key)
+        target = key.encode("utf-8")
+        order = self.order
+        low, high = 0, len(self.table)
+        while low < high:
+            middle = (low + high) // 2
+            i = middle if order is None else order[middle]
+            if self.table.raw(i) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(self.table):
+            i = low if order is None else order[low]
+            if self.table.raw(i) == target:
+                return i
+        raise KeyError(key)
+
+
+class Records(Mapping):
+    """
+    Read-only dictionary of people or movies stored by column,
+    shaped as degrees.load_data fills it in compact mode: index maps
+    each ID to its position, and each record is built from the
+    fields' columns (string tables or lists) when looked up, with
+    its links (now in the graph) set to None.
+    """
+
+    def __init__(self, index, fields, links):
+        self.index = index
+        self.fields = fields
+        self.links = links
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __getitem__(self, key):
+        i = self.index[key]
+        record = {field: table[i] for field, table in self.fields.items()}
+        record[self.links] = None
+        return record
+
+
+class Names(Mapping):
+    """
+    Read-only dictionary mapping each lowercased name of a snapshot
+    to the set of person_ids of the people with that name.
+    """
+
+    def __init__(self, keys, offsets, people, person_ids):
+        self.index = SortedIndex(keys)
+        self.offsets = offsets
+        self.people = people
+        self.person_ids = person_ids
+
+    def __len__(self):
+        return len(self.index)
+
+    def __iter__(self):
+        return iter(self.index)
+
+    def __getitem__(self, key):
+        k = self.index[key]
+        return {self.person_ids[p]
+                for p in self.people[self.offsets[k]:self.offsets[k + 1]]}
+
+
+def snapshot_path(directory):
+    """Returns the snapshot filename for a dataset directory."""
+    return os.path.join(directory, FILENAME)
+
+
+def is_fresh(directory, path=None):
+    """
+    Returns True if directory has a snapshot, or the file at path,
+    at least as recent as each of its CSV files.
+    """
+    if path is None:
+        path = snapshot_path(directory)
+    if not os.path.exists(path):
+        return False
+    built = os.path.getmtime(path)
+    return all(
+        os.path.getmtime(os.path.join(directory, name)) <= built
+        for name in ("people.csv", "movies.csv", "stars.csv")
+    )
+
+
+def save_snapshot(path, graph, people, movies, names):
+    """
+    Writes graph, together with the people, movies and names
+    dictionaries filled by degrees.load_data, to path.
+    """
+    person_index = graph.person_index
+    name_keys = sorted(names)
+    name_offsets = array("i", [0])
+    name_people = array("i")
+    for key in name_keys:
+        name_people.extend(sorted(person_index[pid] for pid in names[key]))
+        name_offsets.append(len(name_people))
+
+    data = {
+        "person_ids": graph.person_ids,
+        "person_names": [people[pid]["name"] for pid in graph.person_ids],
+        "person_births": [people[pid]["birth"] for pid in graph.person_ids],
+        "movie_ids": graph.movie_ids,
+        "movie_titles": [movies[mid]["title"] for mid in graph.movie_ids],
+        "movie_years": [movies[mid]["year"] for mid in graph.movie_ids],
+        "person_offsets": graph.person_offsets,
+        "person_movies": graph.person_movies,
+        "movie_offsets": graph.movie_offsets,
+        "movie_stars": graph.movie_stars,
+        "name_keys": name_keys,
+        "name_offsets": name_offsets,
+        "name_people": name_people,
+        "person_order": sorted(range(len(graph.person_ids)),
+                               key=graph.person_ids.__getitem__),
+        "movie_order": sorted(range(len(graph.movie_ids)),
+                              key=graph.movie_ids.__getitem__),
+    }
+
+    def int32(values):
+        values = array("i", values)
+        if sys.byteorder == "big":
+            values.byteswap()
+        return values.tobytes()
+
+    blobs = []
+    for name, kind in SECTIONS:
+        if kind == "s":
+            strings = [value.encode("utf-8") for value in data[name]]
+            offsets = array("i", [0])
+            for string in strings:
+                offsets.append(offsets[-1] + len(string))
+            blobs.append(b"".join(strings))
+            blobs.append(int32(offsets))
+        else:
+            blobs.append(int32(data[name]))
+
+    # Keep every section 8-byte aligned so int32 views can be cast
+    layout = []
+    offset = HEADER.size
+    for blob in blobs:
+        layout += [offset, len(blob)]
+        offset += len(blob) + (-len(blob) % 8)
+
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(HEADER.pack(MAGIC, *layout))
+        for blob in blobs:
+            f.write(blob)
+            f.write(b"\0" * (-len(blob) % 8))
+    os.replace(tmp, path)
+
+
+def load_snapshot(path):
+    """
+    Memory-maps the snapshot at path.
+
+    Returns a tuple (graph, people, movies, names) where graph's
+    arrays and ID lookups are views into the shared mapping, and the
+    read-only dictionaries are shaped as degrees.load_data fills them
+    in compact mode, reading each entry from the mapping on access.
+    """
+    with open(path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    magic, *layout = HEADER.unpack_from(buffer)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a degrees snapshot of this "
+                         "version, rebuild it with snapshot.py")
+
+    view = memoryview(buffer)
+    blobs = []
+    for k in range(BLOBS):
+        start, length = layout[2 * k], layout[2 * k + 1]
+        blobs.append(view[start:start + length])
+
+    def int32(blob):
+        if sys.byteorder == "big":
+            values = array("i", blob.tobytes())
+            values.byteswap()
+            return values
+        return blob.cast("i")
+
+    sections = {}
+    blobs = iter(blobs)
+    for name, kind in SECTIONS:
+        if kind == "s":
+            sections[name] = StringTable(next(blobs), int32(next(blobs)))
+        else:
+            sections[name] = int32(next(blobs))
+
+    person_index = SortedIndex(sections["person_ids"],
+                               sections["person_order"])
+    movie_index = SortedIndex(sections["movie_ids"], sections["movie_order"])
+    graph = CompactGraph(
+        sections["person_ids"], sections["movie_ids"],
+        sections["person_offsets"], sections["person_movies"],
+        sections["movie_offsets"], sections["movie_stars"],
+        person_index, movie_index
+    )
+    # The graph's arrays borrow from the mapping, so keep it alive
+    graph.buffer = buffer
+
+    people = Records(person_index, {"name": sections["person_names"],
+                                    "birth": sections["person_births"]},
+                     "movies")
+    movies = Records(movie_index, {"title": sections["movie_titles"],
+                                   "year": sections["movie_years"]},
+                     "stars")
+    names = Names(sections["name_keys"], sections["name_offsets"],
+                  sections["name_people"], sections["person_ids"])
+
+    return graph, people, movies, names
+
+
+def main():
+    if len(sys.argv) > 2:
+        sys.exit("Usage: python snapshot.py [directory]")
+    directory = sys.argv[1] if len(sys.argv) == 2 else "large"
+
+    import degrees
+
+    print("Loading data...")
+    degrees.load_data(directory, snapshot=False,
+                      processes=os.cpu_count())
+    print("Writing snapshot...")
+    path = snapshot_path(directory)
+    save_snapshot(path, degrees.graph,
+                  degrees.people, degrees.movies, degrees.names)
+    print(f"Snapshot written to {path}.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,128 @@
+"""
+Bitboard Tic Tac Toe engine
+
+A board is a pair of 9-bit masks (xs, os) holding the cells taken by
+each player, with cell (i, j) at bit 3 * i + j. Moves are generated
+and wins detected with bit operations, so the search allocates no
+boards.
+"""
+
+from tictactoe import X, O, EMPTY
+
+FULL = 0b111111111
+
+LINES = [
+    0b000000111, 0b000111000, 0b111000000,  # rows
+    0b001001001, 0b010010010, 0b100100100,  # columns
+    0b100010001, 0b001010100,               # diagonals
+]
+
+# WINNING[mask] is 1 if mask covers a whole line
+WINNING = bytes(
+    any(mask & line == line for line in LINES) for mask in range(FULL + 1)
+)
+
+
+def from_board(board):
+    """
+    Returns the (xs, os) masks of a list-of-lists board.
+    """
+    xs = os = 0
+    for i, row in enumerate(board):
+        for j, item in enumerate(row):
+            if item == X:
+                xs |= 1 << (3 * i + j)
+            elif item == O:
+                os |= 1 << (3 * i + j)
+    return xs, os
+
+
+def to_board(xs, os):
+    """
+    Returns the list-of-lists board of (xs, os) masks.
+    """
+    return [[X if xs >> (3 * i + j) & 1 else O if os >> (3 * i + j) & 1
+             else EMPTY for j in range(3)] for i in range(3)]
+
+
+def player(xs, os):
+    """
+    Returns player who has the next turn.
+    """
+    return O if xs.bit_count() > os.bit_count() else X
+
+
+def winner(xs, os):
+    """
+    Returns the winner of the game, if there is one.
+    """
+    if WINNING[xs]:
+        return X
+    if WINNING[os]:
+        return O
+    return None
+
+
+def terminal(xs, os):
+    """
+    Returns True if game is over, False otherwise.
+    """
+    return bool(WINNING[xs] or WINNING[os]) or xs | os == FULL
+
+
+def negamax(me, them, alpha, beta):
+    """
+    Returns the value of a non-terminal position for the player to
+    move, who holds me: 1 for a win, -1 for a loss and 0 for a tie.
+    """
+    empty = FULL & ~(me | them)
+    if not empty:
+        return 0
+
+    best = -2
+    while empty:
+        bit = empty & -empty
+        empty ^= bit
+        if WINNING[me | bit]:
+            return 1
+        value = -negamax(them, me | bit, -beta, -alpha)
+        if value > best:
+            best = value
+            if value > alpha:
+                alpha = value
+                if alpha >= beta:
+                    break
+    return best
+
+
+def best_move(xs, os):
+    """
+    Returns the bit index of the optimal move, or None if the
+    game is over.
+    """
+    if terminal(xs, os):
+        return None
+    me, them = (xs, os) if player(xs, os) == X else (os, xs)
+
+    best = None
+    alpha = -2
+    empty = FULL & ~(me | them)
+    while empty:
+        bit = empty & -empty
+        empty ^= bit
+        if WINNING[me | bit]:
+            return bit.bit_length() - 1
+        value = -negamax(them, me | bit, -2, -alpha)
+        if value > alpha:
+            alpha = value
+            best = bit.bit_length() - 1
+    return best
+
+
+def minimax(board):
+    """
+    Returns the optimal action for the current player on a
+    list-of-lists board, like tictactoe.minimax.
+    """
+    k = best_move(*from_board(board))
+    return None if k is None else divmod(k, 3)
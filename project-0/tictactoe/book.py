@@ -0,0 +1,21 @@
+"""
+Builds the Tic Tac Toe opening book.
+
+Solves every reachable 3 x 3 position once and writes the optimal
+actions next to tictactoe.py, so tictactoe.minimax answers them with
+a single lookup. Run once with:
+
+    python book.py
+"""
+
+import tictactoe as ttt
+
+
+def main():
+    print("Solving positions...")
+    ttt.build_book()
+    print(f"Opening book written to {ttt.BOOK_PATH}.")
+
+
+if __name__ == "__main__":
+    main()
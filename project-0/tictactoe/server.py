@@ -0,0 +1,246 @@
+"""
+Tic Tac Toe game server
+
+Hosts many simultaneous games over TCP. Clients send one JSON object
+per line and get one JSON object per line back:
+
+    {"cmd": "new", "user": "X", "m": 3, "n": 3, "k": 3}
+    {"cmd": "move", "game": 1, "action": [1, 1]}
+    {"cmd": "state", "game": 1}
+    {"cmd": "stats"}
+
+Game state is kept per game. AI moves run on a pool of worker
+processes, so slow searches never block the event loop and searches
+for different games run in parallel rather than taking turns on the
+GIL. Each worker reads the opening book when it starts and keeps its
+own transposition table, so positions one worker searches are not
+seen by the others.
+
+The server itself remembers the action found for every position
+solved exactly (3 x 3 boards with k = 3), for all games and sessions,
+and answers repeated positions without a search; games waiting on the
+same position share one search. Moves on other boards come from a
+time-limited search whose result depends on how far it got, so they
+are not cached and every such move searches anew.
+
+Usage:
+
+    python server.py [port]
+"""
+
+import asyncio
+import concurrent.futures
+import itertools
+import json
+import sys
+import time
+from collections import deque
+
+import tictactoe as ttt
+
+PORT = 8765
+
+# Seconds the AI may think on boards too large to solve exactly
+TIME_LIMIT = 1.0
+
+# Number of recent AI moves kept for latency percentiles
+LATENCY_WINDOW = 10000
+
+
+class Game():
+    def __init__(self, user, m, n, k):
+        self.user = user
+        self.k = k
+        self.board = ttt.initial_state(m, n)
+        self.lock = asyncio.Lock()
+
+    def state(self, game_id):
+        return {
+            "game": game_id,
+            "board": self.board,
+            "player": ttt.player(self.board),
+            "over": ttt.terminal(self.board, self.k),
+            "winner": ttt.winner(self.board, self.k),
+        }
+
+
+class Metrics():
+    """
+    Latencies of recent AI moves, in seconds.
+    """
+
+    def __init__(self, window=LATENCY_WINDOW):
+        self.latencies = deque(maxlen=window)
+        self.moves = 0
+
+    def record(self, latency):
+        self.latencies.append(latency)
+        self.moves += 1
+
+    def summary(self):
+        latencies = sorted(self.latencies)
+        if not latencies:
+            return {"moves": self.moves}
+
+        def percentile(p):
+            return latencies[min(len(latencies) - 1,
+                                 int(p * len(latencies)))]
+
+        return {
+            "moves": self.moves,
+            "mean": sum(latencies) / len(latencies),
+            "p50": percentile(0.5),
+            "p95": percentile(0.95),
+            "p99": percentile(0.99),
+            "max": latencies[-1],
+        }
+
+
+def start_worker():
+    """Loads the opening book in a worker process as it starts."""
+    ttt.opening_book()
+
+
+def exact(board, k):
+    """Checks if the AI solves board exactly rather than in a time limit."""
+    return len(board) == 3 and len(board[0]) == 3 and k == 3
+
+
+def ai_action(board, k):
+    """
+    Returns the AI's action on board. Runs in a worker process.
+    """
+    if exact(board, k):
+        return ttt.minimax(board)
+    return ttt.minimax(board, k=k, time_limit=TIME_LIMIT)
+
+
+class Server():
+    def __init__(self, workers=None):
+        self.games = {}
+        self.ids = itertools.count(1)
+        self.metrics = Metrics()
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            workers, initializer=start_worker)
+
+        # Searches in progress, by position, shared by every game
+        # waiting on the same one
+        self.searches = {}
+
+        # Actions of the positions solved exactly so far, by position
+        self.solved = {}
+
+    def search(self, key, board, k):
+        """
+        Returns a future of the AI's action on board, starting a
+        search unless the same position is already being searched.
+        Exact results are kept in self.solved once found.
+        """
+        if key not in self.searches:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self.executor, ai_action, board, k)
+
+            def done(future):
+                del self.searches[key]
+                if (exact(board, k) and not future.cancelled()
+                        and future.exception() is None):
+                    self.solved[key] = future.result()
+
+            future.add_done_callback(done)
+            self.searches[key] = future
+        return self.searches[key]
+
+    async def play_ai(self, game):
+        """
+        Makes the AI's move on game if it is the AI's turn.
+        """
+        board = game.board
+        if ttt.terminal(board, game.k) or ttt.player(board) == game.user:
+            return
+        start = time.perf_counter()
+        key = (len(board), len(board[0]), game.k, ttt.board_code(board))
+        action = self.solved.get(key)
+        if action is None:
+            action = await asyncio.shield(self.search(key, board, game.k))
+        self.metrics.record(time.perf_counter() - start)
+        game.board = ttt.result(game.board, action)
+
+    async def handle(self, request):
+        """
+        Returns the response to a decoded request.
+        """
+        cmd = request.get("cmd")
+
+        if cmd == "new":
+            user = request.get("user", ttt.X)
+            m = int(request.get("m", 3))
+            n = int(request.get("n", 3))
+            k = int(request.get("k", min(m, n)))
+            if user not in (ttt.X, ttt.O) or min(m, n, k) < 1:
+                raise ValueError("invalid game")
+            game_id = next(self.ids)
+            game = self.games[game_id] = Game(user, m, n, k)
+            async with game.lock:
+                await self.play_ai(game)
+                return game.state(game_id)
+
+        if cmd == "stats":
+            return {"games": len(self.games),
+                    "latency": self.metrics.summary()}
+
+        game_id = request.get("game")
+        if game_id not in self.games:
+            raise ValueError("unknown game")
+        game = self.games[game_id]
+
+        if cmd == "state":
+            return game.state(game_id)
+
+        if cmd == "move":
+            async with game.lock:
+                if ttt.terminal(game.board, game.k):
+                    raise ValueError("game over")
+                if ttt.player(game.board) != game.user:
+                    raise ValueError("not your turn")
+                game.board = ttt.result(game.board,
+                                        tuple(request.get("action", ())))
+                await self.play_ai(game)
+                return game.state(game_id)
+
+        if cmd == "close":
+            del self.games[game_id]
+            return {"game": game_id, "closed": True}
+
+        raise ValueError("unknown command")
+
+    async def serve_client(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                try:
+                    response = await self.handle(json.loads(line))
+                except Exception as e:
+                    response = {"error": str(e)}
+                writer.write(json.dumps(response).encode() + b"\n")
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def run(self, port=PORT):
+        server = await asyncio.start_server(self.serve_client, port=port)
+        async with server:
+            await server.serve_forever()
+
+
+def main():
+    if len(sys.argv) > 2:
+        sys.exit("Usage: python server.py [port]")
+    port = int(sys.argv[1]) if len(sys.argv) == 2 else PORT
+    print(f"Serving Tic-Tac-Toe on port {port}...")
+    try:
+        asyncio.run(Server().run(port))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
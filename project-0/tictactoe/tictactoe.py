@@ -1,22 +1,54 @@
 """
 Tic Tac Toe Player
+
+Boards are m x n lists of lists, and a player wins with k in a row
+horizontally, vertically or diagonally. Functions taking k default
+to k = min(m, n), which is the classic game on a 3 x 3 board.
 """
 
 import math
 import copy
+import os
+import time
 
 X = "X"
 O = "O"
 EMPTY = None
 
+# Transposition table flags: the stored value is exact, or only a
+# lower or upper bound of the true value
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+# Maps (m, n) board shapes to their rotations and reflections
+SYMMETRIES = {}
+
+# Maps (m, n, k) to the k-cell windows of an m x n board
+WINDOWS = {}
+
+# Maps canonical board keys to (value, flag, canonical cell index)
+transpositions = {}
+
+# Solved 3 x 3 positions, built by book.py: byte board_code(board) is
+# the index 3 * i + j of the optimal action, or NO_ACTION
+BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         "tictactoe.book")
+NO_ACTION = 255
+
+# Contents of BOOK_PATH, read on first use (empty if there is none)
+book = None
 
-def initial_state():
+
+class SearchTimeout(Exception):
+    """Raised inside a search when its time budget runs out."""
+
+
+def initial_state(m=3, n=3):
     """
-    Returns starting state of the board.
+    Returns starting state of an m x n board.
     """
-    return [[EMPTY, EMPTY, EMPTY],
-            [EMPTY, EMPTY, EMPTY],
-            [EMPTY, EMPTY, EMPTY]]
+    return [[EMPTY] * n for _ in range(m)]
 
 
 def player(board):
@@ -49,7 +81,8 @@ def result(board, action):
     Returns the board that results from making move (i, j) on the board.
     """
     i, j = action
-    if i < 0 or j < 0 or i >= 3 or j >= 3 or board[i][j] is not None:
+    if (i < 0 or j < 0 or i >= len(board) or j >= len(board[i])
+            or board[i][j] is not None):
         raise Exception('invalid action')
     new_board_state = copy.deepcopy(board)
     p = player(board)
@@ -57,54 +90,172 @@ def result(board, action):
     return new_board_state
 
 
-def winner(board):
+def in_a_row(board, k=None):
     """
-    Returns the winner of the game, if there is one.
+    Returns k, or the default k = min(m, n) for the board if None.
     """
-    for i in range(3):
-        if board[i][0] is not None and board[i][0] == board[i][1] == board[i][2]:
-            return board[i][0]
+    return min(len(board), len(board[0])) if k is None else k
 
-    for j in range(3):
-        if board[0][j] is not None and board[0][j] == board[1][j] == board[2][j]:
-            return board[0][j]
 
-    if board[0][0] is not None and board[0][0] == board[1][1] == board[2][2]:
-        return board[0][0]
+def wins_at(board, i, j, k):
+    """
+    Returns True if the piece at (i, j) is part of k in a row.
+    """
+    p = board[i][j]
+    m, n = len(board), len(board[0])
+    for di, dj in ((0, 1), (1, 0), (1, 1), (1, -1)):
+        count = 1
+        for sign in (1, -1):
+            a, b = i + sign * di, j + sign * dj
+            while 0 <= a < m and 0 <= b < n and board[a][b] == p:
+                count += 1
+                a += sign * di
+                b += sign * dj
+        if count >= k:
+            return True
+    return False
+
+
+def winner(board, k=None):
+    """
+    Returns the winner of the game, if there is one.
+    """
+    k = in_a_row(board, k)
+    for i, row in enumerate(board):
+        for j, item in enumerate(row):
+            if item is not None and wins_at(board, i, j, k):
+                return item
+    return None
 
-    if board[0][2] is not None and board[0][2] == board[1][1] == board[2][0]:
-        return board[0][2]
 
-    return None
-    
-def terminal(board):
+def terminal(board, k=None):
     """
     Returns True if game is over, False otherwise.
     """
-    if winner(board) is not None:
+    if winner(board, k) is not None:
         return True
     return all(item is not None for row in board for item in row)
 
 
-def utility(board):
+def utility(board, k=None):
     """
     Returns 1 if X has won the game, -1 if O has won, 0 otherwise.
     """
-    return { X: 1, None: 0, O: -1 }[winner(board)]
+    return { X: 1, None: 0, O: -1 }[winner(board, k)]
+
+
+def symmetries(m, n):
+    """
+    Returns the rotations and reflections of an m x n board, as
+    permutations of the cell indices n * i + j: cell c of a
+    transformed board is cell symmetry[c] of the original.
+    """
+    if (m, n) not in SYMMETRIES:
+        maps = [
+            lambda i, j: (i, j),
+            lambda i, j: (m - 1 - i, j),
+            lambda i, j: (i, n - 1 - j),
+            lambda i, j: (m - 1 - i, n - 1 - j),
+        ]
+        if m == n:
+            maps += [
+                lambda i, j: (j, i),
+                lambda i, j: (n - 1 - j, i),
+                lambda i, j: (j, m - 1 - i),
+                lambda i, j: (n - 1 - j, m - 1 - i),
+            ]
+        SYMMETRIES[(m, n)] = [
+            tuple(n * a + b for a, b in (f(c // n, c % n)
+                                         for c in range(m * n)))
+            for f in maps
+        ]
+    return SYMMETRIES[(m, n)]
+
+
+def canonical(board, k):
+    """
+    Returns (key, symmetry) where key identifies the board and k up
+    to rotations and reflections, and symmetry is the permutation
+    that maps the board onto its canonical form.
+    """
+    m, n = len(board), len(board[0])
+    codes = [{EMPTY: 0, X: 1, O: 2}[item] for row in board for item in row]
+    best = None
+    for symmetry in symmetries(m, n):
+        key = 0
+        for c in symmetry:
+            key = 3 * key + codes[c]
+        if best is None or key < best[0]:
+            best = (key, symmetry)
+    return (m, n, k, best[0]), best[1]
+
+
+def probe(table, board, k, alpha, beta):
+    """
+    Looks board up in a transposition table.
+
+    Returns (key, symmetry, alpha, beta, hit) with the window narrowed
+    by any stored bound; hit is the (value, action) to return at once,
+    or None if the board still has to be searched.
+    """
+    key, symmetry = canonical(board, k)
+    entry = table.get(key)
+    if entry is None:
+        return key, symmetry, alpha, beta, None
+
+    value, flag, c = entry
+    action = divmod(symmetry[c], len(board[0])) if c is not None else None
+    if flag == EXACT:
+        return key, symmetry, alpha, beta, (value, action)
+    if flag == LOWER:
+        alpha = max(alpha, value)
+    else:
+        beta = min(beta, value)
+    if alpha > beta:
+        return key, symmetry, alpha, beta, (value, action)
+    return key, symmetry, alpha, beta, None
 
 
-def max_val(board, alpha, beta):
+def store(table, board, key, symmetry, value, action, alpha, beta):
+    """
+    Records the value searched with window (alpha, beta) for a board,
+    with its action mapped to canonical coordinates.
+    """
+    if value <= alpha:
+        flag = UPPER
+    elif value >= beta:
+        flag = LOWER
+    else:
+        flag = EXACT
+    c = None
+    if action is not None:
+        c = symmetry.index(len(board[0]) * action[0] + action[1])
+    table[key] = (value, flag, c)
+
+
+def max_val(board, alpha, beta, table=None, k=None):
     """
     Maximizes the utility of board with alpha-beta pruning.
+
+    Positions are memoized in table, the module's shared
+    transpositions table if None.
     """
-    if terminal(board):
-        return utility(board), None
-    
+    k = in_a_row(board, k)
+    if terminal(board, k):
+        return utility(board, k), None
+
+    if table is None:
+        table = transpositions
+    key, symmetry, alpha, beta, hit = probe(table, board, k, alpha, beta)
+    if hit is not None:
+        return hit
+    alpha_start, beta_start = alpha, beta
+
     v = -2
     a = None
 
     for action in actions(board):
-        nv, _ = min_val(result(board, action), alpha, beta)
+        nv, _ = min_val(result(board, action), alpha, beta, table, k)
 
         if nv >= v:
             v = nv
@@ -113,23 +264,35 @@ def max_val(board, alpha, beta):
         alpha = max(alpha, v)
 
         if alpha > beta:
-            return v, a
-        
+            break
+
+    store(table, board, key, symmetry, v, a, alpha_start, beta_start)
     return v, a
 
 
-def min_val(board, alpha, beta):
+def min_val(board, alpha, beta, table=None, k=None):
     """
     Minimizes the utility of board with alpha-beta pruning.
+
+    Positions are memoized in table, the module's shared
+    transpositions table if None.
     """
-    if terminal(board):
-        return utility(board), None
-    
+    k = in_a_row(board, k)
+    if terminal(board, k):
+        return utility(board, k), None
+
+    if table is None:
+        table = transpositions
+    key, symmetry, alpha, beta, hit = probe(table, board, k, alpha, beta)
+    if hit is not None:
+        return hit
+    alpha_start, beta_start = alpha, beta
+
     v = 2
     a = None
 
     for action in actions(board):
-        nv, _ = max_val(result(board, action), alpha, beta)
+        nv, _ = max_val(result(board, action), alpha, beta, table, k)
 
         if nv <= v:
             v = nv
@@ -138,19 +301,236 @@ def min_val(board, alpha, beta):
         beta = min(beta, v)
 
         if alpha > beta:
-            return v, a
-        
+            break
+
+    store(table, board, key, symmetry, v, a, alpha_start, beta_start)
     return v, a
 
 
-def minimax(board):
+def windows(m, n, k):
     """
-    Returns the optimal action for the current player on the board.
+    Returns every list of k cells in a row on an m x n board.
+    """
+    if (m, n, k) not in WINDOWS:
+        WINDOWS[(m, n, k)] = [
+            [(i + s * di, j + s * dj) for s in range(k)]
+            for i in range(m) for j in range(n)
+            for di, dj in ((0, 1), (1, 0), (1, 1), (1, -1))
+            if 0 <= i + (k - 1) * di < m and 0 <= j + (k - 1) * dj < n
+        ]
+    return WINDOWS[(m, n, k)]
+
+
+def win_score(board, k):
+    """
+    Returns a score larger than any heuristic evaluation of board.
+    """
+    m, n = len(board), len(board[0])
+    return 10 ** k * (len(windows(m, n, k)) + 1)
+
+
+def evaluate(board, k):
+    """
+    Estimates a non-terminal board for X: every window of k cells
+    that only one player has pieces in scores 10 ** pieces for that
+    player, positive for X and negative for O.
+    """
+    score = 0
+    for window in windows(len(board), len(board[0]), k):
+        nx = no = 0
+        for i, j in window:
+            item = board[i][j]
+            if item == X:
+                nx += 1
+            elif item == O:
+                no += 1
+        if nx and not no:
+            score += 10 ** nx
+        elif no and not nx:
+            score -= 10 ** no
+    return score
+
+
+def ordered_actions(board):
+    """
+    Returns the available actions, those next to more pieces first
+    and then those closer to the center.
+    """
+    m, n = len(board), len(board[0])
+
+    def priority(action):
+        i, j = action
+        near = sum(
+            1 for a in range(max(0, i - 1), min(m, i + 2))
+            for b in range(max(0, j - 1), min(n, j + 2))
+            if board[a][b] is not None
+        )
+        return (-near, abs(2 * i - m + 1) + abs(2 * j - n + 1), i, j)
+
+    return sorted(actions(board), key=priority)
+
+
+def bounded_search(board, k, turn, depth, alpha, beta, deadline):
+    """
+    Returns the value of a non-terminal board for turn, the player
+    to move, searching depth plies with alpha-beta pruning and the
+    heuristic evaluation below that.
+
+    Moves are made and undone in place on board. Raises
+    SearchTimeout once time.monotonic() passes deadline.
+    """
+    if time.monotonic() > deadline:
+        raise SearchTimeout
+    if depth == 0:
+        return evaluate(board, k) if turn == X else -evaluate(board, k)
+
+    moves = ordered_actions(board)
+    if not moves:
+        return 0
+
+    other = O if turn == X else X
+    best = -math.inf
+    for i, j in moves:
+        board[i][j] = turn
+        if wins_at(board, i, j, k):
+            # Prefer the quickest win
+            value = win_score(board, k) + depth
+        else:
+            value = -bounded_search(
+                board, k, other, depth - 1, -beta, -alpha, deadline)
+        board[i][j] = EMPTY
+
+        if value > best:
+            best = value
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+    return best
+
+
+def iterative_deepening(board, time_limit, k=None):
+    """
+    Returns the best action found for the current player within
+    time_limit seconds, by searching one ply deeper at a time.
+
+    Each depth searches the moves in the order scored by the
+    previous one, and the result of the deepest completed depth
+    is returned.
+    """
+    k = in_a_row(board, k)
+    if terminal(board, k):
+        return None
+    deadline = time.monotonic() + time_limit
+    board = [row[:] for row in board]
+    turn = player(board)
+    other = O if turn == X else X
+    moves = ordered_actions(board)
+    win = win_score(board, k)
+
+    for depth in range(1, len(moves) + 1):
+        scores = {}
+        alpha = -math.inf
+        try:
+            for i, j in moves:
+                board[i][j] = turn
+                if wins_at(board, i, j, k):
+                    value = win + depth
+                else:
+                    value = -bounded_search(
+                        board, k, other, depth - 1, -math.inf, -alpha,
+                        deadline)
+                board[i][j] = EMPTY
+                scores[(i, j)] = value
+                alpha = max(alpha, value)
+        except SearchTimeout:
+            break
+        moves.sort(key=lambda action: -scores[action])
+        if scores[moves[0]] >= win:
+            break
+
+    return moves[0]
+
+
+def board_code(board):
+    """
+    Returns the base 3 number with one digit per cell of the board,
+    row by row: 0 for EMPTY, 1 for X and 2 for O.
+    """
+    code = 0
+    for row in board:
+        for item in row:
+            code = 3 * code + {EMPTY: 0, X: 1, O: 2}[item]
+    return code
+
+
+def opening_book():
+    """
+    Returns the solved positions of BOOK_PATH, reading the file on
+    the first call, or an empty book if it has not been built.
+    """
+    global book
+    if book is None:
+        try:
+            with open(BOOK_PATH, "rb") as f:
+                book = f.read()
+        except FileNotFoundError:
+            book = b""
+    return book
+
+
+def build_book(path=BOOK_PATH):
+    """
+    Solves every 3 x 3 board reachable from initial_state() with the
+    minimax search and writes the optimal actions to path.
+    """
+    solved = bytearray([NO_ACTION]) * 3 ** 9
+    seen = set()
+    boards = [initial_state()]
+    while boards:
+        board = boards.pop()
+        code = board_code(board)
+        if code in seen or terminal(board):
+            continue
+        seen.add(code)
+        i, j = search(board, None, None)
+        solved[code] = 3 * i + j
+        boards.extend(result(board, action) for action in actions(board))
+
+    with open(path, "wb") as f:
+        f.write(solved)
+
+
+def search(board, table, k):
+    """
+    Returns the optimal action found by the exhaustive alpha-beta
+    search behind minimax.
     """
     p = player(board)
     if p == X:
-        v, a = max_val(board, -2, 2)
+        v, a = max_val(board, -2, 2, table, k)
     else:
-        v, a = min_val(board, -2, 2)
+        v, a = min_val(board, -2, 2, table, k)
     return a
-    
+
+
+def minimax(board, table=None, k=None, time_limit=None):
+    """
+    Returns the optimal action for the current player on the board.
+
+    3 x 3 boards are looked up in the opening book once it is built.
+    Other positions are searched, keeping searched positions in
+    table (the module's shared transpositions table if None), so
+    later calls reuse them.
+
+    If time_limit is given, the best action found by an
+    iterative-deepening search within that many seconds is
+    returned instead, for boards too large to search exhaustively.
+    """
+    if time_limit is not None:
+        return iterative_deepening(board, time_limit, k)
+    if (len(board) == 3 and len(board[0]) == 3 and k in (None, 3)
+            and opening_book()):
+        action = opening_book()[board_code(board)]
+        if action != NO_ACTION:
+            return divmod(action, 3)
+    return search(board, table, k)
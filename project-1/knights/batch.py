@@ -0,0 +1,134 @@
+"""
+Solves many logic puzzles in one run.
+
+Reads puzzles from a file, or from stdin if no file or "-" is given.
+Each puzzle starts with a "puzzle: <name>" line, followed by the
+sentences of its knowledge base in the text form of logic.to_text:
+
+    puzzle: Puzzle 0
+    (or "A is a Knight" "A is a Knave")
+    (not (and "A is a Knight" "A is a Knave"))
+    (iff "A is a Knight" (and "A is a Knight" "A is a Knave"))
+
+Blank lines and lines starting with "#" are ignored. Puzzles are
+solved on a pool of processes, and each puzzle's entailed symbols are
+printed as soon as it is solved, in input order.
+"""
+
+import multiprocessing
+import sys
+
+from logic import *
+
+# Ways of finding the entailed symbols of a puzzle
+BACKENDS = ["model_check", "bitwise", "sat", "kb"]
+
+# Number of puzzles sent to a worker at a time
+CHUNK_SIZE = 16
+
+
+def read_puzzles(lines):
+    """
+    Yields a (name, sentence lines) pair per puzzle in lines, without
+    parsing the sentences.
+    """
+    name = None
+    sentences = []
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("puzzle:"):
+            if name is not None:
+                yield name, sentences
+            name = line[len("puzzle:"):].strip()
+            sentences = []
+        elif name is None:
+            raise ValueError(f"line {number}: sentence outside a puzzle")
+        else:
+            sentences.append(line)
+    if name is not None:
+        yield name, sentences
+
+
+def write_puzzles(f, puzzles):
+    """Writes (name, knowledge) pairs to file f."""
+    for name, knowledge in puzzles:
+        print(f"puzzle: {name}", file=f)
+        if not isinstance(knowledge, And):
+            knowledge = And(knowledge)
+        for sentence in knowledge.conjuncts:
+            print(to_text(sentence), file=f)
+        print(file=f)
+
+
+def entailed(knowledge, backend="kb"):
+    """
+    Returns the symbols entailed by knowledge, in order of name,
+    found with backend.
+    """
+    symbols = [Symbol(name) for name in sorted(knowledge.symbols())]
+    if backend == "kb":
+        return KnowledgeBase(knowledge).entailed(symbols)
+    check = {
+        "model_check": model_check,
+        "bitwise": bitwise_model_check,
+        "sat": sat_check,
+    }[backend]
+    return [symbol for symbol in symbols if check(knowledge, symbol)]
+
+
+def solve(job):
+    """
+    Solves a (name, sentence lines, backend) job in a worker.
+
+    Returns (name, names of the entailed symbols).
+    """
+    name, sentences, backend = job
+    knowledge = And(*parse("\n".join(sentences)))
+    return name, [symbol.name for symbol in entailed(knowledge, backend)]
+
+
+def run(puzzles, backend="kb", processes=None, chunk_size=CHUNK_SIZE):
+    """
+    Solves (name, sentence lines) puzzles on a pool of processes,
+    yielding (name, entailed symbol names) in input order as soon as
+    each is solved.
+    """
+    jobs = ((name, sentences, backend) for name, sentences in puzzles)
+    with multiprocessing.Pool(processes) as pool:
+        yield from pool.imap(solve, jobs, chunk_size)
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    flags = [arg for arg in sys.argv[1:] if arg.startswith("--")]
+    options = {"--backend": "kb", "--processes": None}
+    for flag in flags:
+        name, _, value = flag.partition("=")
+        if name not in options or not value:
+            args = None
+            break
+        options[name] = value
+    if (args is None or len(args) > 1
+            or options["--backend"] not in BACKENDS
+            or not (options["--processes"] or "1").isdigit()):
+        sys.exit("Usage: python batch.py [puzzles] "
+                 f"[--backend={'|'.join(BACKENDS)}] [--processes=N]")
+    processes = options["--processes"]
+    if processes is not None:
+        processes = int(processes)
+    filename = args[0] if args else "-"
+
+    f = sys.stdin if filename == "-" else open(filename, encoding="utf-8")
+    with f:
+        for name, symbols in run(read_puzzles(f), options["--backend"],
+                                 processes):
+            print(name)
+            for symbol in symbols:
+                print(f"    {symbol}")
+            sys.stdout.flush()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,133 @@
+"""
+Benchmarks the ways of solving knights and knaves puzzles.
+
+Generates random puzzles in which each character is a knight or a
+knave and says one random statement about the characters, then
+reports how many puzzles per second each backend of batch.py solves
+on one process, and how many the batch solver solves on a pool.
+
+Usage:
+
+    python benchmark.py [count] [--characters=N] [--processes=N]
+                        [--backends=name,...] [--seed=N] [--write=FILE]
+
+--write saves the generated puzzles in the batch.py file format.
+"""
+
+import random
+import sys
+import time
+
+import batch
+from logic import *
+
+CHARACTERS = "ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+def statement(knights, knaves, depth):
+    """Returns a random statement about the characters."""
+    i = random.randrange(len(knights))
+    if depth == 0 or random.random() < 0.3:
+        return random.choice([knights, knaves])[i]
+    kind = random.choice([Not, And, Or, Implication, Biconditional])
+    if kind is Not:
+        return Not(statement(knights, knaves, depth - 1))
+    return kind(statement(knights, knaves, depth - 1),
+                statement(knights, knaves, depth - 1))
+
+
+def generate(count, characters=4, depth=2):
+    """
+    Returns count random (name, knowledge) puzzles, each with at least
+    one solution.
+    """
+    puzzles = []
+    while len(puzzles) < count:
+        names = CHARACTERS[:characters]
+        knights = [Symbol(f"{c} is a Knight") for c in names]
+        knaves = [Symbol(f"{c} is a Knave") for c in names]
+        knowledge = And()
+        for knight, knave in zip(knights, knaves):
+            knowledge.add(Or(knight, knave))
+            knowledge.add(Not(And(knight, knave)))
+        for knight in knights:
+            knowledge.add(Biconditional(
+                knight, statement(knights, knaves, depth)))
+        if KnowledgeBase(knowledge).solver.solve():
+            puzzles.append((f"Puzzle {len(puzzles)}", knowledge))
+    return puzzles
+
+
+def measure(puzzles, backend):
+    """Returns (puzzles per second, solutions) for backend."""
+    start = time.perf_counter()
+    solutions = [batch.entailed(knowledge, backend)
+                 for _, knowledge in puzzles]
+    return len(puzzles) / (time.perf_counter() - start), solutions
+
+
+def measure_pool(puzzles, backend, processes):
+    """
+    Returns (puzzles per second, solutions) for the batch solver,
+    including writing the puzzles out for its workers.
+    """
+    start = time.perf_counter()
+    jobs = [(name, [to_text(sentence) for sentence in knowledge.conjuncts])
+            for name, knowledge in puzzles]
+    solutions = [[Symbol(name) for name in names]
+                 for _, names in batch.run(jobs, backend, processes)]
+    return len(puzzles) / (time.perf_counter() - start), solutions
+
+
+def main():
+    args = [arg for arg in sys.argv[1:] if not arg.startswith("--")]
+    flags = [arg for arg in sys.argv[1:] if arg.startswith("--")]
+    options = {"--characters": "4", "--processes": None, "--seed": "0",
+               "--backends": ",".join(batch.BACKENDS), "--write": None}
+    for flag in flags:
+        name, _, value = flag.partition("=")
+        if name not in options or not value:
+            args = None
+            break
+        options[name] = value
+    numbers = [args[0]] if args else []
+    numbers += [options["--characters"], options["--seed"],
+                options["--processes"] or "1"]
+    backends = options["--backends"].split(",")
+    if (args is None or len(args) > 1
+            or not all(number.isdigit() for number in numbers)
+            or not set(backends) <= set(batch.BACKENDS)):
+        sys.exit("Usage: python benchmark.py [count] [--characters=N] "
+                 "[--processes=N] [--backends=name,...] [--seed=N] "
+                 "[--write=FILE]")
+    count = int(args[0]) if args else 200
+    characters = int(options["--characters"])
+    processes = options["--processes"]
+    if processes is not None:
+        processes = int(processes)
+
+    random.seed(int(options["--seed"]))
+    puzzles = generate(count, characters)
+    if options["--write"] is not None:
+        with open(options["--write"], "w", encoding="utf-8") as f:
+            batch.write_puzzles(f, puzzles)
+
+    print(f"{count} puzzles with {characters} characters")
+    expected = None
+    for backend in backends:
+        rate, solutions = measure(puzzles, backend)
+        print(f"    {backend:<20} {rate:10.1f} puzzles/sec")
+        if expected is None:
+            expected = solutions
+        elif solutions != expected:
+            sys.exit(f"{backend} disagrees with {backends[0]}")
+
+    backend = backends[-1]
+    rate, solutions = measure_pool(puzzles, backend, processes)
+    print(f"    {backend + ' (pool)':<20} {rate:10.1f} puzzles/sec")
+    if solutions != expected:
+        sys.exit("batch solver disagrees")
+
+
+if __name__ == "__main__":
+    main()
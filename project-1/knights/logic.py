@@ -1,8 +1,160 @@
+import functools
 import itertools
+import json
+import re
+import weakref
+
+from sat import Solver
+
+# Number of symbols whose values are enumerated within one block of
+# models by bitwise_model_check: each block covers 2 ** BLOCK_BITS models
+BLOCK_BITS = 16
+
+# First bytes of sentences serialized with to_bytes
+MAGIC = b"LOGIC1\n"
+
+# Subsentences nesting deeper or holding more connectives than these
+# are compiled into local variables rather than inline (see flatten)
+INLINE_DEPTH = 32
+INLINE_SIZE = 256
+
+# Tokens of the text format: parentheses, quoted and bare names
+TOKEN = re.compile(r'\s*(?:(\()|(\))|"((?:[^"\\]|\\.)*)"|([^\s()"]+))')
+BARE = re.compile(r'[^\s()"]+')
+
+
+def postorder(sentence, done=()):
+    """
+    Yields sentence and each of its distinct subsentences once, parts
+    before the sentences made of them, skipping the subsentences in
+    done along with their parts. Walks an explicit stack, so
+    sentences of any depth work.
+    """
+    seen = set()
+    stack = [(sentence, False)]
+    while stack:
+        node, expanded = stack.pop()
+        if id(node) in seen or node in done:
+            continue
+        if expanded:
+            seen.add(id(node))
+            yield node
+            continue
+        stack.append((node, True))
+        for part in reversed(node.parts()):
+            stack.append((part, False))
+
+
+def flatten(sentence, arguments, expression, start, check, end):
+    """
+    Returns a function of arguments evaluating sentence, with
+    expression(node, parts) giving the Python expression of each
+    distinct subsentence from the expressions of its parts.
+
+    Each conjunct of a conjunction is checked in turn by the lines
+    check formatted with its value, so the function can stop at the
+    first false one; the function starts with line start, if any,
+    and ends with line end. Subsentences are compiled inline into
+    their parents, which keeps and/or short-circuiting, until they nest
+    deeper than INLINE_DEPTH or grow past INLINE_SIZE connectives:
+    those are computed into local variables of their own, so the
+    generated code stays shallow and shared subsentences are not
+    copied over and over, however large sentence is.
+    """
+    conjuncts = [sentence]
+    if isinstance(sentence, And):
+        conjuncts = sentence.conjuncts
+
+    # (expression, nesting depth, size) of each subsentence compiled
+    # so far: depth 0 for names, which need no parentheses
+    values = {}
+    lines = [f"def evaluate({arguments}):"]
+    if start:
+        lines.append("    " + start)
+    for conjunct in conjuncts:
+        for node in postorder(conjunct, values):
+            parts = [values[part] for part in node.parts()]
+            code = expression(node, [
+                f"({part})" if depth else part for part, depth, _ in parts])
+            if isinstance(node, Symbol):
+                values[node] = (code, 0, 0)
+                continue
+            depth = 1 + max((depth for _, depth, _ in parts), default=0)
+            size = 1 + sum(size for _, _, size in parts)
+            if depth > INLINE_DEPTH or size > INLINE_SIZE:
+                name = f"t{len(lines)}"
+                lines.append(f"    {name} = {code}")
+                values[node] = (name, 0, 0)
+            else:
+                values[node] = (code, depth, size)
+        code = check.format(values[conjunct][0])
+        lines.extend("    " + line for line in code.split("\n"))
+    lines.append("    " + end)
+    namespace = {}
+    exec("\n".join(lines), namespace)
+    return namespace["evaluate"]
+
+
+def cached_formula(formula):
+    """Caches the formula of a sentence until the sentence changes."""
+    @functools.wraps(formula)
+    def wrapper(self):
+        if self.text is None:
+            self.text = formula(self)
+        return self.text
+    return wrapper
 
 
 class Sentence():
 
+    # Sentences are hash-consed: structurally equal sentences are one
+    # object, found here by class and (interned) parts, so equality
+    # and hashing are by identity
+    interned = weakref.WeakValueDictionary()
+
+    # Names of all symbols in the sentence, and its cached formula
+    names = frozenset()
+    text = None
+
+    # Functions compiled from the sentence, by kind and symbol bits
+    compiled = None
+
+    # Interned sentences may be shared, so they never change
+    shared = True
+
+    @staticmethod
+    def intern(cls, *parts):
+        """
+        Returns the sentence of class cls made of parts, building it
+        only if no structurally equal sentence exists yet.
+        """
+        key = (cls,) + parts
+        sentence = Sentence.interned.get(key)
+        if sentence is None:
+            sentence = object.__new__(cls)
+            sentence.build(*parts)
+            Sentence.interned[key] = sentence
+        return sentence
+
+    def canonical(self):
+        """Returns the interned sentence equal to this one."""
+        return self
+
+    def part(self):
+        """
+        Returns the interned sentence standing for this one as a part
+        of another sentence.
+        """
+        return self.canonical()
+
+    def parts(self):
+        """Returns the list of subsentences of the logical sentence."""
+        return []
+
+    def __reduce__(self):
+        # Pickled as one flat string, however deep the sentence is
+        return (from_bytes, (to_bytes(self),))
+
     def evaluate(self, model):
         """Evaluates the logical sentence."""
         raise Exception("nothing to evaluate")
@@ -13,7 +165,67 @@ class Sentence():
 
     def symbols(self):
         """Returns a set of all symbols in the logical sentence."""
-        return set()
+        return set(self.names)
+
+    def python(self, index, parts):
+        """
+        Returns a Python expression evaluating the logical sentence on
+        an integer model m, where bit index[name] of m holds the value
+        of each symbol, given the expressions of its parts' values.
+        """
+        raise Exception("nothing to compile")
+
+    def compiled_function(self, kind, index, compile):
+        """
+        Returns the function compile() made for the logical sentence
+        and the bits index gives its symbols, compiling it only the
+        first time. The function is kept on the interned sentence, so
+        equal sentences share it.
+        """
+        sentence = self.canonical()
+        key = (kind,) + tuple(index[name] for name in sorted(sentence.names))
+        if sentence.compiled is None:
+            sentence.compiled = {}
+        if key not in sentence.compiled:
+            sentence.compiled[key] = compile()
+        return sentence.compiled[key]
+
+    def compile(self, index):
+        """
+        Returns a function evaluating the logical sentence on integer
+        models, whose bits are the symbols' values (see python).
+        """
+        return self.compiled_function("python", index, lambda: flatten(
+            self, "m", lambda node, parts: node.python(index, parts),
+            None, "if not ({}): return False", "return True"))
+
+    def bitwise(self, index, parts):
+        """
+        Returns a Python expression evaluating the logical sentence on
+        a block of models at once, given the expressions of its parts'
+        values: s[index[name]] is an integer whose bit k is the value
+        of each symbol in model k of the block, and FULL has one bit
+        set per model. Bit k of the result is the value of the
+        sentence in model k.
+        """
+        raise Exception("nothing to compile")
+
+    def compile_bitwise(self, index):
+        """
+        Returns a function of (s, FULL) evaluating the logical sentence
+        on a block of models at once (see bitwise).
+        """
+        return self.compiled_function("bitwise", index, lambda: flatten(
+            self, "s, FULL", lambda node, parts: node.bitwise(index, parts),
+            "v = FULL", "v &= {}\nif not v: return 0", "return v"))
+
+    def tseitin(self, encoder, literals):
+        """
+        Returns a literal of encoder equivalent to the logical
+        sentence, given the literals of its parts, adding the clauses
+        that define it to encoder.
+        """
+        raise Exception("nothing to encode")
 
     @classmethod
     def validate(cls, sentence):
@@ -44,14 +256,15 @@ class Sentence():
 
 class Symbol(Sentence):
 
-    def __init__(self, name):
-        self.name = name
+    def __new__(cls, name):
+        return Sentence.intern(cls, name)
 
-    def __eq__(self, other):
-        return isinstance(other, Symbol) and self.name == other.name
+    def build(self, name):
+        self.name = name
+        self.names = frozenset([name])
 
-    def __hash__(self):
-        return hash(("symbol", self.name))
+    def __reduce__(self):
+        return (Symbol, (self.name,))
 
     def __repr__(self):
         return self.name
@@ -65,20 +278,27 @@ class Symbol(Sentence):
     def formula(self):
         return self.name
 
-    def symbols(self):
-        return {self.name}
+    def python(self, index, parts):
+        return f"(m >> {index[self.name]} & 1)"
+
+    def bitwise(self, index, parts):
+        return f"s[{index[self.name]}]"
+
+    def tseitin(self, encoder, literals):
+        return encoder.variable(self.name)
 
 
 class Not(Sentence):
-    def __init__(self, operand):
+    def __new__(cls, operand):
         Sentence.validate(operand)
-        self.operand = operand
+        return Sentence.intern(cls, operand.part())
 
-    def __eq__(self, other):
-        return isinstance(other, Not) and self.operand == other.operand
+    def build(self, operand):
+        self.operand = operand
+        self.names = operand.names
 
-    def __hash__(self):
-        return hash(("not", hash(self.operand)))
+    def parts(self):
+        return [self.operand]
 
     def __repr__(self):
         return f"Not({self.operand})"
@@ -86,26 +306,62 @@ class Not(Sentence):
     def evaluate(self, model):
         return not self.operand.evaluate(model)
 
+    @cached_formula
     def formula(self):
         return "¬" + Sentence.parenthesize(self.operand.formula())
 
-    def symbols(self):
-        return self.operand.symbols()
+    def python(self, index, parts):
+        return f"not {parts[0]}"
+
+    def bitwise(self, index, parts):
+        return f"FULL ^ {parts[0]}"
+
+    def tseitin(self, encoder, literals):
+        return -literals[0]
 
 
 class And(Sentence):
-    def __init__(self, *conjuncts):
+    """
+    Conjunction of sentences. A conjunction built directly can still
+    grow with add until it is used as a part of another sentence:
+    from then on its interned copy stands for it there, so add raises
+    rather than leave the other sentence out of date.
+    """
+
+    # Set once the conjunction is a part of another sentence
+    used = False
+
+    def __new__(cls, *conjuncts):
         for conjunct in conjuncts:
             Sentence.validate(conjunct)
+        self = object.__new__(cls)
+        self.build(*(conjunct.part() for conjunct in conjuncts))
+        self.shared = False
+        return self
+
+    def build(self, *conjuncts):
         self.conjuncts = list(conjuncts)
+        self.names = frozenset().union(
+            *(conjunct.names for conjunct in conjuncts))
+        self.copy = None
+
+    def canonical(self):
+        if self.shared:
+            return self
+        if self.copy is None:
+            self.copy = Sentence.intern(And, *self.conjuncts)
+        return self.copy
 
     def __eq__(self, other):
-        return isinstance(other, And) and self.conjuncts == other.conjuncts
+        if not isinstance(other, Sentence):
+            return NotImplemented
+        return self.canonical() is other.canonical()
 
     def __hash__(self):
-        return hash(
-            ("and", tuple(hash(conjunct) for conjunct in self.conjuncts))
-        )
+        return object.__hash__(self.canonical())
+
+    def parts(self):
+        return self.conjuncts
 
     def __repr__(self):
         conjunctions = ", ".join(
@@ -113,36 +369,68 @@ class And(Sentence):
         )
         return f"And({conjunctions})"
 
+    def part(self):
+        self.used = True
+        return self.canonical()
+
     def add(self, conjunct):
+        """
+        Adds conjunct to the conjunction, which must not be interned
+        or already used as a part of another sentence.
+        """
         Sentence.validate(conjunct)
-        self.conjuncts.append(conjunct)
+        if self.shared:
+            raise Exception("cannot add to a shared sentence")
+        if self.used:
+            raise Exception("cannot add to a conjunction used in "
+                            "another sentence")
+        self.conjuncts.append(conjunct.part())
+        self.names = self.names | conjunct.names
+        self.text = None
+        self.copy = None
 
     def evaluate(self, model):
         return all(conjunct.evaluate(model) for conjunct in self.conjuncts)
 
+    @cached_formula
     def formula(self):
         if len(self.conjuncts) == 1:
             return self.conjuncts[0].formula()
         return " ∧ ".join([Sentence.parenthesize(conjunct.formula())
                            for conjunct in self.conjuncts])
 
-    def symbols(self):
-        return set.union(*[conjunct.symbols() for conjunct in self.conjuncts])
+    def python(self, index, parts):
+        if not parts:
+            return "True"
+        return " and ".join(parts)
+
+    def bitwise(self, index, parts):
+        if not parts:
+            return "FULL"
+        return " & ".join(parts)
+
+    def tseitin(self, encoder, literals):
+        x = encoder.new_variable()
+        for literal in literals:
+            encoder.add_clause([-x, literal])
+        encoder.add_clause([x] + [-literal for literal in literals])
+        return x
 
 
 class Or(Sentence):
-    def __init__(self, *disjuncts):
+    def __new__(cls, *disjuncts):
         for disjunct in disjuncts:
             Sentence.validate(disjunct)
+        return Sentence.intern(
+            cls, *(disjunct.part() for disjunct in disjuncts))
+
+    def build(self, *disjuncts):
         self.disjuncts = list(disjuncts)
+        self.names = frozenset().union(
+            *(disjunct.names for disjunct in disjuncts))
 
-    def __eq__(self, other):
-        return isinstance(other, Or) and self.disjuncts == other.disjuncts
-
-    def __hash__(self):
-        return hash(
-            ("or", tuple(hash(disjunct) for disjunct in self.disjuncts))
-        )
+    def parts(self):
+        return self.disjuncts
 
     def __repr__(self):
         disjuncts = ", ".join([str(disjunct) for disjunct in self.disjuncts])
@@ -151,30 +439,45 @@ class Or(Sentence):
     def evaluate(self, model):
         return any(disjunct.evaluate(model) for disjunct in self.disjuncts)
 
+    @cached_formula
     def formula(self):
         if len(self.disjuncts) == 1:
             return self.disjuncts[0].formula()
         return " ∨  ".join([Sentence.parenthesize(disjunct.formula())
                             for disjunct in self.disjuncts])
 
-    def symbols(self):
-        return set.union(*[disjunct.symbols() for disjunct in self.disjuncts])
+    def python(self, index, parts):
+        if not parts:
+            return "False"
+        return " or ".join(parts)
+
+    def bitwise(self, index, parts):
+        if not parts:
+            return "0"
+        return " | ".join(parts)
+
+    def tseitin(self, encoder, literals):
+        x = encoder.new_variable()
+        for literal in literals:
+            encoder.add_clause([x, -literal])
+        encoder.add_clause([-x] + literals)
+        return x
 
 
 class Implication(Sentence):
-    def __init__(self, antecedent, consequent):
+    def __new__(cls, antecedent, consequent):
         Sentence.validate(antecedent)
         Sentence.validate(consequent)
+        return Sentence.intern(
+            cls, antecedent.part(), consequent.part())
+
+    def build(self, antecedent, consequent):
         self.antecedent = antecedent
         self.consequent = consequent
+        self.names = antecedent.names | consequent.names
 
-    def __eq__(self, other):
-        return (isinstance(other, Implication)
-                and self.antecedent == other.antecedent
-                and self.consequent == other.consequent)
-
-    def __hash__(self):
-        return hash(("implies", hash(self.antecedent), hash(self.consequent)))
+    def parts(self):
+        return [self.antecedent, self.consequent]
 
     def __repr__(self):
         return f"Implication({self.antecedent}, {self.consequent})"
@@ -183,29 +486,42 @@ class Implication(Sentence):
         return ((not self.antecedent.evaluate(model))
                 or self.consequent.evaluate(model))
 
+    @cached_formula
     def formula(self):
         antecedent = Sentence.parenthesize(self.antecedent.formula())
         consequent = Sentence.parenthesize(self.consequent.formula())
         return f"{antecedent} => {consequent}"
 
-    def symbols(self):
-        return set.union(self.antecedent.symbols(), self.consequent.symbols())
+    def python(self, index, parts):
+        antecedent, consequent = parts
+        return f"not {antecedent} or {consequent}"
+
+    def bitwise(self, index, parts):
+        antecedent, consequent = parts
+        return f"(FULL ^ {antecedent}) | {consequent}"
+
+    def tseitin(self, encoder, literals):
+        x = encoder.new_variable()
+        a, b = literals
+        encoder.add_clause([-x, -a, b])
+        encoder.add_clause([x, a])
+        encoder.add_clause([x, -b])
+        return x
 
 
 class Biconditional(Sentence):
-    def __init__(self, left, right):
+    def __new__(cls, left, right):
         Sentence.validate(left)
         Sentence.validate(right)
+        return Sentence.intern(cls, left.part(), right.part())
+
+    def build(self, left, right):
         self.left = left
         self.right = right
+        self.names = left.names | right.names
 
-    def __eq__(self, other):
-        return (isinstance(other, Biconditional)
-                and self.left == other.left
-                and self.right == other.right)
-
-    def __hash__(self):
-        return hash(("biconditional", hash(self.left), hash(self.right)))
+    def parts(self):
+        return [self.left, self.right]
 
     def __repr__(self):
         return f"Biconditional({self.left}, {self.right})"
@@ -216,48 +532,429 @@ class Biconditional(Sentence):
                 or (not self.left.evaluate(model)
                     and not self.right.evaluate(model)))
 
+    @cached_formula
     def formula(self):
         left = Sentence.parenthesize(str(self.left))
         right = Sentence.parenthesize(str(self.right))
         return f"{left} <=> {right}"
 
-    def symbols(self):
-        return set.union(self.left.symbols(), self.right.symbols())
+    def python(self, index, parts):
+        # Every compiled value is 0, 1, False or True, so they compare
+        # as their truth values
+        left, right = parts
+        return f"{left} == {right}"
+
+    def bitwise(self, index, parts):
+        left, right = parts
+        return f"FULL ^ {left} ^ {right}"
+
+    def tseitin(self, encoder, literals):
+        x = encoder.new_variable()
+        a, b = literals
+        encoder.add_clause([-x, -a, b])
+        encoder.add_clause([-x, a, -b])
+        encoder.add_clause([x, a, b])
+        encoder.add_clause([x, -a, -b])
+        return x
+
+
+# Keywords of the text format and opcodes of the binary format
+OPERATORS = {
+    "not": Not,
+    "and": And,
+    "or": Or,
+    "implies": Implication,
+    "iff": Biconditional,
+}
+KEYWORDS = {cls: keyword for keyword, cls in OPERATORS.items()}
+CLASSES = [Symbol, Not, And, Or, Implication, Biconditional]
+OPCODES = {cls: opcode for opcode, cls in enumerate(CLASSES)}
+
+
+def build(cls, parts):
+    """Returns the sentence of class cls made of parts."""
+    if cls is Not and len(parts) != 1:
+        raise ValueError("not takes one sentence")
+    if cls in (Implication, Biconditional) and len(parts) != 2:
+        raise ValueError(f"{KEYWORDS[cls]} takes two sentences")
+    return cls(*parts)
+
+
+def to_text(sentence):
+    """
+    Returns the text form of sentence: symbols are names, quoted
+    as JSON strings unless they are a single bare word, and other
+    sentences are parenthesized keywords followed by their parts:
+
+        (and (or A B) (not (and A B)) (iff A "A is a Knight"))
+    """
+    words = []
+    stack = [sentence]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, str):
+            words.append(item)
+        elif isinstance(item, Symbol):
+            name = item.name
+            if not BARE.fullmatch(name):
+                name = json.dumps(name, ensure_ascii=False)
+            words.append(name)
+        else:
+            words.append("(" + KEYWORDS[type(item)])
+            stack.append(")")
+            for part in reversed(item.parts()):
+                stack.append(part)
+                stack.append(" ")
+    return "".join(words)
+
+
+def parse(text):
+    """Returns the list of sentences written in text (see to_text)."""
+    sentences = []
+    stack = []
+    opened = False
+    position = 0
+    end = len(text.rstrip())
+    while position < end:
+        match = TOKEN.match(text, position)
+        if match is None:
+            raise ValueError(f"unexpected character at {position}")
+        position = match.end()
+        opening, closing, quoted, bare = match.groups()
+
+        if opened:
+            if bare not in OPERATORS:
+                raise ValueError(f"expected an operator at {match.start()}")
+            stack.append((OPERATORS[bare], []))
+            opened = False
+            continue
+        if opening:
+            opened = True
+            continue
+        if closing:
+            if not stack:
+                raise ValueError(f"unbalanced parenthesis at {match.start()}")
+            sentence = build(*stack.pop())
+        elif quoted is not None:
+            if "\\" in quoted:
+                quoted = json.loads(f'"{quoted}"')
+            sentence = Symbol(quoted)
+        else:
+            sentence = Symbol(bare)
+        (stack[-1][1] if stack else sentences).append(sentence)
+
+    if stack or opened:
+        raise ValueError("unexpected end of text")
+    return sentences
+
+
+def write_varint(data, n):
+    """Appends unsigned integer n to data, 7 bits per byte."""
+    while n >= 0x80:
+        data.append(n & 0x7F | 0x80)
+        n >>= 7
+    data.append(n)
+
+
+def read_varint(data, position):
+    """Returns (integer, next position) read at position of data."""
+    n = shift = 0
+    while True:
+        byte = data[position]
+        position += 1
+        n |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return n, position
+        shift += 7
+
+
+def to_bytes(sentence):
+    """
+    Returns the binary form of sentence: after MAGIC, one record per
+    distinct subsentence, parts before the sentences that use them.
+    A record is an opcode byte, then the UTF-8 name of a symbol or
+    how far back each part's record is, with the number of parts of
+    And and Or first. The sentence itself is the last record.
+    """
+    data = bytearray(MAGIC)
+    numbers = {}
+    stack = [sentence]
+    while stack:
+        node = stack[-1]
+        if id(node) in numbers:
+            stack.pop()
+            continue
+        pending = [part for part in node.parts() if id(part) not in numbers]
+        if pending:
+            stack.extend(reversed(pending))
+            continue
+        stack.pop()
+
+        number = len(numbers)
+        data.append(OPCODES[type(node)])
+        if isinstance(node, Symbol):
+            name = node.name.encode("utf-8")
+            write_varint(data, len(name))
+            data += name
+        else:
+            if isinstance(node, (And, Or)):
+                write_varint(data, len(node.parts()))
+            for part in node.parts():
+                write_varint(data, number - numbers[id(part)])
+        numbers[id(node)] = number
+    return bytes(data)
+
+
+def from_bytes(data):
+    """Returns the sentence serialized in data (see to_bytes)."""
+    if not data.startswith(MAGIC):
+        raise ValueError("not a serialized sentence")
+    nodes = []
+    position = len(MAGIC)
+    try:
+        while position < len(data):
+            cls = CLASSES[data[position]]
+            position += 1
+            if cls is Symbol:
+                length, position = read_varint(data, position)
+                name = bytes(data[position:position + length])
+                if len(name) < length:
+                    raise IndexError
+                nodes.append(Symbol(name.decode("utf-8")))
+                position += length
+                continue
+
+            if cls is Not:
+                count = 1
+            elif cls in (And, Or):
+                count, position = read_varint(data, position)
+            else:
+                count = 2
+            parts = []
+            for _ in range(count):
+                offset, position = read_varint(data, position)
+                if not 0 < offset <= len(nodes):
+                    raise IndexError
+                parts.append(nodes[-offset])
+            nodes.append(cls(*parts))
+    except IndexError:
+        raise ValueError("corrupt serialized sentence")
+    if not nodes:
+        raise ValueError("empty serialized sentence")
+    return nodes[-1]
+
+
+def save(filename, sentence, binary=True):
+    """
+    Saves sentence to a file, in binary or as text with each
+    conjunct of a knowledge base on its own line.
+    """
+    if binary:
+        with open(filename, "wb") as f:
+            f.write(to_bytes(sentence))
+        return
+    sentences = [sentence]
+    if isinstance(sentence, And) and len(sentence.conjuncts) > 1:
+        sentences = sentence.conjuncts
+    with open(filename, "w", encoding="utf-8") as f:
+        for s in sentences:
+            f.write(to_text(s) + "\n")
+
+
+def load(filename):
+    """
+    Returns the sentence saved in a file: the conjunction of its
+    sentences if it holds text with more than one.
+    """
+    with open(filename, "rb") as f:
+        data = f.read()
+    if data.startswith(MAGIC):
+        return from_bytes(data)
+    sentences = parse(data.decode("utf-8"))
+    if len(sentences) == 1:
+        return sentences[0]
+    return And(*sentences)
 
 
 def model_check(knowledge, query):
     """Checks if knowledge base entails query."""
 
-    def check_all(knowledge, query, symbols, model):
-        """Checks if knowledge base entails query, given a particular model."""
-
-        # If model has an assignment for each symbol
-        if not symbols:
-
-            # If knowledge base is true in model, then query must also be true
-            if knowledge.evaluate(model):
-                return query.evaluate(model)
+    # Get all symbols in both knowledge and query, and give each one
+    # a bit of an integer model
+    symbols = sorted(set.union(knowledge.symbols(), query.symbols()))
+    index = {symbol: i for i, symbol in enumerate(symbols)}
+
+    # Compile both sentences into flat evaluators over those bits
+    knowledge = knowledge.compile(index)
+    query = query.compile(index)
+
+    # If knowledge base is true in a model, then query must also be true
+    for model in range(1 << len(symbols)):
+        if knowledge(model) and not query(model):
+            return False
+    return True
+
+
+def bitwise_model_check(knowledge, query, block_bits=BLOCK_BITS):
+    """
+    Checks if knowledge base entails query, evaluating both over
+    blocks of up to 2 ** block_bits models at once with one bit per
+    model, and stopping at the first block with a counter-model.
+    """
+    symbols = sorted(set.union(knowledge.symbols(), query.symbols()))
+    index = {symbol: i for i, symbol in enumerate(symbols)}
+    knowledge = knowledge.compile_bitwise(index)
+    query = query.compile_bitwise(index)
+
+    # The first symbols vary within a block: symbol i is true in the
+    # models of the block whose number has bit i set
+    inner = min(len(symbols), block_bits)
+    size = 1 << inner
+    full = (1 << size) - 1
+    patterns = []
+    for i in range(inner):
+        period = 1 << (i + 1)
+        ones = ((1 << (1 << i)) - 1) << (1 << i)
+        patterns.append(ones * (full // ((1 << period) - 1)))
+
+    # The remaining symbols are constant within a block
+    outer = len(symbols) - inner
+    for block in range(1 << outer):
+        s = patterns + [full if block >> j & 1 else 0 for j in range(outer)]
+        models = knowledge(s, full)
+        if models and models & (full ^ query(s, full)):
+            return False
+    return True
+
+
+class Encoder():
+    """
+    Tseitin encoding of logical sentences into CNF clauses over
+    integer literals: each symbol and each connective gets a variable,
+    and the clauses make every connective's variable equivalent to
+    its subsentence, so the clauses grow linearly with the sentences.
+    """
+
+    def __init__(self):
+        self.variables = {}
+        self.literals = {}
+        self.clauses = []
+        self.count = 0
+
+    def new_variable(self):
+        self.count += 1
+        return self.count
+
+    def variable(self, name):
+        """Returns the variable of the symbol called name."""
+        if name not in self.variables:
+            self.variables[name] = self.new_variable()
+        return self.variables[name]
+
+    def literal(self, sentence):
+        """
+        Returns a literal equivalent to sentence, encoding each
+        distinct subsentence only once, parts first.
+        """
+        for node in postorder(sentence, self.literals):
+            self.literals[node] = node.tseitin(
+                self, [self.literals[part] for part in node.parts()])
+        return self.literals[sentence]
+
+    def add_clause(self, clause):
+        self.clauses.append(clause)
+
+    def add(self, sentence):
+        """Adds clauses requiring sentence to be true."""
+        stack = [sentence]
+        while stack:
+            sentence = stack.pop()
+            if isinstance(sentence, And):
+                stack.extend(reversed(sentence.conjuncts))
+            else:
+                self.add_clause([self.literal(sentence)])
+
+
+def sat_check(knowledge, query):
+    """
+    Checks if knowledge base entails query, by asking a SAT solver
+    whether knowledge and the negation of query can both be true.
+    Takes the same arguments as model_check.
+    """
+    encoder = Encoder()
+    encoder.add(knowledge)
+    encoder.add(Not(query))
+
+    solver = Solver()
+    for clause in encoder.clauses:
+        if not solver.add_clause(clause):
             return True
-        else:
-
-            # Choose one of the remaining unused symbols
-            remaining = symbols.copy()
-            p = remaining.pop()
-
-            # Create a model where the symbol is true
-            model_true = model.copy()
-            model_true[p] = True
-
-            # Create a model where the symbol is false
-            model_false = model.copy()
-            model_false[p] = False
-
-            # Ensure entailment holds in both models
-            return (check_all(knowledge, query, remaining, model_true) and
-                    check_all(knowledge, query, remaining, model_false))
-
-    # Get all symbols in both knowledge and query
-    symbols = set.union(knowledge.symbols(), query.symbols())
-
-    # Check that knowledge entails query
-    return check_all(knowledge, query, symbols, dict())
+    return not solver.solve()
+
+
+class KnowledgeBase():
+    """
+    Knowledge base that keeps one SAT solver across queries. Sentences
+    can be added at any time; each query is answered by solving under
+    the assumption that it is false, so clauses learned while
+    answering one query speed up the next.
+    """
+
+    def __init__(self, *sentences):
+        self.encoder = Encoder()
+        self.solver = Solver()
+        for sentence in sentences:
+            self.add(sentence)
+
+    def flush(self):
+        """Passes the clauses encoded so far on to the solver."""
+        for clause in self.encoder.clauses:
+            self.solver.add_clause(clause)
+        self.encoder.clauses = []
+        self.solver.reserve(self.encoder.count)
+
+    def add(self, sentence):
+        """Adds sentence to the knowledge base."""
+        Sentence.validate(sentence)
+        self.encoder.add(sentence)
+        self.flush()
+
+    def literal(self, query):
+        """Returns the solver literal equivalent to query."""
+        Sentence.validate(query)
+        literal = self.encoder.literal(query)
+        self.flush()
+        return literal
+
+    def entails(self, query):
+        """Checks if the knowledge base entails query."""
+        return not self.solver.solve([-self.literal(query)])
+
+    def entailed(self, queries):
+        """
+        Returns the list of queries entailed by the knowledge base.
+
+        Every model found along the way rules out all the queries it
+        makes false, so most queries that are not entailed never need
+        a solver call of their own.
+        """
+        queries = list(queries)
+        literals = [self.literal(query) for query in queries]
+        if not self.solver.solve():
+            return queries
+
+        def true_in_model(literal):
+            return self.solver.model[abs(literal)] == (literal > 0)
+
+        candidates = [true_in_model(literal) for literal in literals]
+        entailed = []
+        for i, query in enumerate(queries):
+            if not candidates[i]:
+                continue
+            if self.solver.solve([-literals[i]]):
+                for j in range(i + 1, len(queries)):
+                    if candidates[j] and not true_in_model(literals[j]):
+                        candidates[j] = False
+            else:
+                entailed.append(query)
+        return entailed
@@ -0,0 +1,266 @@
+import heapq
+
+
+class Solver():
+    """
+    CDCL SAT solver over clauses of integer literals, where v > 0
+    stands for variable v and -v for its negation.
+
+    Clauses are watched by two literals for unit propagation,
+    conflicts are analyzed to their first unique implication point
+    and learned, and decisions follow variable activity. Learned
+    clauses are kept between calls to solve, and each call may fix
+    some literals as assumptions.
+    """
+
+    def __init__(self):
+        # Per-variable state, indexed by variable (index 0 is unused)
+        self.assigns = [None]
+        self.levels = [0]
+        self.reasons = [None]
+        self.phases = [False]
+        self.activity = [0.0]
+
+        # Clauses watching each literal, checked when it becomes false
+        self.watches = {}
+        self.trail = []
+        self.trail_limits = []
+        self.head = 0
+
+        self.order = []
+        self.increment = 1.0
+        self.ok = True
+        self.model = None
+        self.conflicts = 0
+
+    def variables(self):
+        """Returns the number of variables known to the solver."""
+        return len(self.assigns) - 1
+
+    def reserve(self, variable):
+        """Makes room for variables up to variable."""
+        while len(self.assigns) <= variable:
+            v = len(self.assigns)
+            self.assigns.append(None)
+            self.levels.append(0)
+            self.reasons.append(None)
+            self.phases.append(False)
+            self.activity.append(0.0)
+            self.watches[v] = []
+            self.watches[-v] = []
+            heapq.heappush(self.order, (0.0, v))
+
+    def value(self, literal):
+        """Returns True, False or None if literal is unassigned."""
+        value = self.assigns[abs(literal)]
+        if value is None or literal > 0:
+            return value
+        return not value
+
+    def level(self):
+        """Returns the current decision level."""
+        return len(self.trail_limits)
+
+    def add_clause(self, literals):
+        """
+        Adds a clause. Returns False if the clauses are now known
+        to be unsatisfiable.
+        """
+        if not self.ok:
+            return False
+        self.backtrack(0)
+
+        clause = []
+        for literal in literals:
+            self.reserve(abs(literal))
+            if -literal in clause or self.value(literal) is True:
+                return True
+            if literal not in clause and self.value(literal) is None:
+                clause.append(literal)
+
+        if not clause:
+            self.ok = False
+        elif len(clause) == 1:
+            self.enqueue(clause[0], None)
+            self.ok = self.propagate() is None
+        else:
+            self.attach(clause)
+        return self.ok
+
+    def attach(self, clause):
+        self.watches[clause[0]].append(clause)
+        self.watches[clause[1]].append(clause)
+
+    def enqueue(self, literal, reason):
+        v = abs(literal)
+        self.assigns[v] = literal > 0
+        self.levels[v] = self.level()
+        self.reasons[v] = reason
+        self.trail.append(literal)
+
+    def propagate(self):
+        """
+        Assigns every literal implied by unit clauses.
+
+        Returns a conflicting clause, or None.
+        """
+        while self.head < len(self.trail):
+            false_literal = -self.trail[self.head]
+            self.head += 1
+            watching = self.watches[false_literal]
+            kept = []
+            for k, clause in enumerate(watching):
+                # Keep the false literal in the second position
+                if clause[0] == false_literal:
+                    clause[0], clause[1] = clause[1], clause[0]
+                if self.value(clause[0]) is True:
+                    kept.append(clause)
+                    continue
+
+                for w in range(2, len(clause)):
+                    if self.value(clause[w]) is not False:
+                        clause[1], clause[w] = clause[w], clause[1]
+                        self.watches[clause[1]].append(clause)
+                        break
+                else:
+                    kept.append(clause)
+                    if self.value(clause[0]) is False:
+                        kept.extend(watching[k + 1:])
+                        self.watches[false_literal] = kept
+                        return clause
+                    self.enqueue(clause[0], clause)
+            self.watches[false_literal] = kept
+        return None
+
+    def analyze(self, conflict):
+        """
+        Returns (learned clause, backjump level) for a conflict, with
+        the asserting literal first.
+        """
+        seen = set()
+        learned = [None]
+        pending = 0
+        literal = None
+        clause = conflict
+        index = len(self.trail) - 1
+
+        while True:
+            for q in (clause if literal is None else clause[1:]):
+                v = abs(q)
+                if v not in seen and self.levels[v] > 0:
+                    seen.add(v)
+                    self.bump(v)
+                    if self.levels[v] == self.level():
+                        pending += 1
+                    else:
+                        learned.append(q)
+
+            while abs(self.trail[index]) not in seen:
+                index -= 1
+            literal = self.trail[index]
+            index -= 1
+            clause = self.reasons[abs(literal)]
+            seen.discard(abs(literal))
+            pending -= 1
+            if pending == 0:
+                break
+
+        learned[0] = -literal
+        if len(learned) == 1:
+            return learned, 0
+
+        # Watch the literal assigned last after the asserting one
+        k = max(range(1, len(learned)),
+                key=lambda k: self.levels[abs(learned[k])])
+        learned[1], learned[k] = learned[k], learned[1]
+        return learned, self.levels[abs(learned[1])]
+
+    def bump(self, v):
+        self.activity[v] += self.increment
+        if self.activity[v] > 1e100:
+            self.activity = [a * 1e-100 for a in self.activity]
+            self.increment *= 1e-100
+            self.order = [(-a, u) for u, a in enumerate(self.activity) if u]
+            heapq.heapify(self.order)
+        heapq.heappush(self.order, (-self.activity[v], v))
+
+    def backtrack(self, level):
+        """Undoes every assignment above level."""
+        if self.level() <= level:
+            return
+        start = self.trail_limits[level]
+        for literal in self.trail[start:]:
+            v = abs(literal)
+            self.phases[v] = self.assigns[v]
+            self.assigns[v] = None
+            self.reasons[v] = None
+            heapq.heappush(self.order, (-self.activity[v], v))
+        del self.trail[start:]
+        del self.trail_limits[level:]
+        self.head = len(self.trail)
+
+    def pick(self):
+        """Returns the most active unassigned variable, or None."""
+        while self.order:
+            _, v = heapq.heappop(self.order)
+            if self.assigns[v] is None:
+                return v
+        return None
+
+    def solve(self, assumptions=()):
+        """
+        Returns True if the clauses, with every literal in assumptions
+        taken as true, have a model, and stores it in self.model as a
+        list of values indexed by variable.
+        """
+        self.model = None
+        if not self.ok:
+            return False
+        for literal in assumptions:
+            self.reserve(abs(literal))
+        self.backtrack(0)
+
+        restart = 100
+        conflicts = 0
+        while True:
+            conflict = self.propagate()
+            if conflict is not None:
+                self.conflicts += 1
+                conflicts += 1
+                if self.level() == 0:
+                    self.ok = False
+                    return False
+                learned, level = self.analyze(conflict)
+                self.backtrack(level)
+                if len(learned) == 1:
+                    self.enqueue(learned[0], None)
+                else:
+                    self.attach(learned)
+                    self.enqueue(learned[0], learned)
+                self.increment /= 0.95
+                continue
+
+            if conflicts >= restart:
+                conflicts = 0
+                restart = int(restart * 1.5)
+                self.backtrack(0)
+                continue
+
+            if self.level() < len(assumptions):
+                literal = assumptions[self.level()]
+                value = self.value(literal)
+                if value is False:
+                    self.backtrack(0)
+                    return False
+                self.trail_limits.append(len(self.trail))
+                if value is None:
+                    self.enqueue(literal, None)
+                continue
+
+            v = self.pick()
+            if v is None:
+                self.model = list(self.assigns)
+                self.backtrack(0)
+                return True
+            self.trail_limits.append(len(self.trail))
+            self.enqueue(v if self.phases[v] else -v, None)
@@ -0,0 +1,133 @@
+import io
+import os
+import pickle
+import tempfile
+import unittest
+
+import batch
+from logic import *
+
+A = Symbol("A")
+B = Symbol("B")
+
+# Depths past the limits of nested Python expressions and of recursion
+DEPTHS = [300, 500, 2000]
+
+
+def chain(depth):
+    """
+    Returns (knowledge, query) where knowledge nests depth connectives
+    and entails query.
+    """
+    sentence = A
+    negated = False
+    for i in range(depth):
+        if i % 2:
+            sentence = Not(sentence)
+            negated = not negated
+        else:
+            sentence = Or(sentence, B)
+    return And(Not(B), sentence), Not(A) if negated else A
+
+
+class DeepSentenceTest(unittest.TestCase):
+
+    def check(self, entails):
+        for depth in DEPTHS:
+            with self.subTest(depth=depth):
+                knowledge, query = chain(depth)
+                self.assertTrue(entails(knowledge, query))
+                self.assertFalse(entails(knowledge, Not(query)))
+
+    def test_model_check(self):
+        self.check(model_check)
+
+    def test_bitwise_model_check(self):
+        self.check(bitwise_model_check)
+
+    def test_sat_check(self):
+        self.check(sat_check)
+
+    def test_knowledge_base(self):
+        for depth in DEPTHS:
+            with self.subTest(depth=depth):
+                knowledge, query = chain(depth)
+                self.assertEqual(
+                    KnowledgeBase(knowledge).entailed([A, Not(A), Not(B)]),
+                    [query, Not(B)])
+
+
+class CompileTest(unittest.TestCase):
+
+    def test_cached(self):
+        knowledge = And(Or(A, B), Not(B))
+        index = {"A": 0, "B": 1}
+        compiled = knowledge.compile(index)
+        self.assertIs(And(Or(A, B), Not(B)).compile(index), compiled)
+        self.assertIsNot(knowledge.compile({"A": 1, "B": 0}), compiled)
+        knowledge.add(A)
+        self.assertIsNot(knowledge.compile(index), compiled)
+
+    def test_add_after_use(self):
+        knowledge = And(A)
+        sentence = Or(knowledge, Not(A))
+        with self.assertRaises(Exception):
+            knowledge.add(B)
+        self.assertEqual(sentence.symbols(), {"A"})
+        self.assertEqual(knowledge.formula(), "A")
+
+    def test_shared(self):
+        # Each level uses the one below twice, so inlining every
+        # subsentence would double the code per level
+        sentence = A
+        for _ in range(100):
+            sentence = And(Or(sentence, B), Or(sentence, Not(B)))
+        self.assertTrue(model_check(sentence, A))
+        self.assertTrue(bitwise_model_check(sentence, A))
+        self.assertFalse(model_check(sentence, B))
+
+
+class DeepSerializationTest(unittest.TestCase):
+
+    def check(self, round_trip):
+        for depth in DEPTHS:
+            with self.subTest(depth=depth):
+                knowledge, query = chain(depth)
+                copy = round_trip(knowledge)
+                self.assertEqual(copy, knowledge)
+                self.assertEqual(batch.entailed(copy), [query])
+
+    def test_bytes(self):
+        self.check(lambda sentence: from_bytes(to_bytes(sentence)))
+
+    def test_text(self):
+        self.check(lambda sentence: parse(to_text(sentence))[0])
+
+    def test_pickle(self):
+        self.check(lambda sentence: pickle.loads(pickle.dumps(sentence)))
+
+    def test_file(self):
+        def round_trip(sentence):
+            with tempfile.TemporaryDirectory() as directory:
+                filename = os.path.join(directory, "knowledge")
+                save(filename, sentence)
+                return load(filename)
+        self.check(round_trip)
+
+    def test_batch(self):
+        puzzles = [(f"Puzzle {depth}", chain(depth)[0]) for depth in DEPTHS]
+        f = io.StringIO()
+        batch.write_puzzles(f, puzzles)
+        f.seek(0)
+        jobs = list(batch.read_puzzles(f))
+        expected = [(f"Puzzle {depth}", [chain(depth)[1]])
+                    for depth in DEPTHS]
+        for backend in batch.BACKENDS:
+            with self.subTest(backend=backend):
+                solutions = [(name, [Symbol(n) for n in names])
+                             for name, names in batch.run(jobs, backend, 2)]
+                self.assertEqual(solutions, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
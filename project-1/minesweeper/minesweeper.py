@@ -1,6 +1,70 @@
-import itertools
+import math
 import random
 
+# Largest number of cells in a frontier component whose mine
+# arrangements are all enumerated by MinesweeperAI.make_best_guess
+COMPONENT_LIMIT = 20
+
+# Most frontier components whose arrangements are weighted exactly
+# by the number of mines left
+EXACT_COMPONENTS = 8
+
+# Number of random cells tried before listing every candidate cell
+SAMPLES = 32
+
+
+def edge_kind(k, size):
+    """
+    Returns the kind of row or column k of a board with size rows or
+    columns: bit 0 is set if there is one before it, bit 1 if there
+    is one after it.
+    """
+    return (k > 0) | (k < size - 1) << 1
+
+
+def neighbor_offsets():
+    """
+    Returns a table of the (di, dj) offsets from a cell to the cells
+    around it, indexed by the kinds of its row and column.
+    """
+    table = []
+    for row_kind in range(4):
+        rows = [0] + [-1] * (row_kind & 1) + [1] * (row_kind >> 1)
+        table.append([])
+        for column_kind in range(4):
+            columns = ([0] + [-1] * (column_kind & 1)
+                       + [1] * (column_kind >> 1))
+            table[-1].append([(di, dj) for di in rows for dj in columns
+                              if (di, dj) != (0, 0)])
+    return table
+
+
+OFFSETS = neighbor_offsets()
+
+
+def neighbor_counts(board, height, width):
+    """
+    Returns a bytearray with the number of mines around each cell of
+    a flat board of bytes, row by row.
+
+    The whole board is summed at once as one big integer with a byte
+    per cell: adding it to itself shifted by a cell each way sums
+    every cell with its row neighbours, and doing the same by a row
+    adds the rows above and below. Counts never exceed 9, so no byte
+    carries into the next, and a zero byte after each row keeps rows
+    from bleeding into each other.
+    """
+    stride = width + 1
+    padded = b"".join(board[i * width:(i + 1) * width] + b"\0"
+                      for i in range(height))
+    cells = int.from_bytes(padded, "little")
+    rows = cells + (cells << 8) + (cells >> 8)
+    boxes = rows + (rows << 8 * stride) + (rows >> 8 * stride)
+    counts = ((boxes - cells) & ((1 << 8 * len(padded)) - 1)).to_bytes(
+        len(padded), "little")
+    return bytearray(b"".join(counts[i * stride:i * stride + width]
+                              for i in range(height)))
+
 
 class Minesweeper():
     """
@@ -14,21 +78,17 @@ class Minesweeper():
         self.width = width
         self.mines = set()
 
-        # Initialize an empty field with no mines
-        self.board = []
-        for i in range(self.height):
-            row = []
-            for j in range(self.width):
-                row.append(False)
-            self.board.append(row)
+        # Initialize an empty field with no mines, one byte per cell
+        # row by row
+        self.board = bytearray(height * width)
 
         # Add mines randomly
-        while len(self.mines) != mines:
-            i = random.randrange(height)
-            j = random.randrange(width)
-            if not self.board[i][j]:
-                self.mines.add((i, j))
-                self.board[i][j] = True
+        for k in random.sample(range(height * width), mines):
+            self.board[k] = 1
+            self.mines.add(divmod(k, width))
+
+        # Count the mines around every cell at once
+        self.counts = neighbor_counts(self.board, height, width)
 
         # At first, player has found no mines
         self.mines_found = set()
@@ -41,7 +101,7 @@ class Minesweeper():
         for i in range(self.height):
             print("--" * self.width + "-")
             for j in range(self.width):
-                if self.board[i][j]:
+                if self.board[i * self.width + j]:
                     print("|X", end="")
                 else:
                     print("| ", end="")
@@ -50,7 +110,7 @@ class Minesweeper():
 
     def is_mine(self, cell):
         i, j = cell
-        return self.board[i][j]
+        return bool(self.board[i * self.width + j])
 
     def nearby_mines(self, cell):
         """
@@ -59,23 +119,8 @@ class Minesweeper():
         not including the cell itself.
         """
 
-        # Keep count of nearby mines
-        count = 0
-
-        # Loop over all cells within one row and column
-        for i in range(cell[0] - 1, cell[0] + 2):
-            for j in range(cell[1] - 1, cell[1] + 2):
-
-                # Ignore the cell itself
-                if (i, j) == cell:
-                    continue
-
-                # Update count if cell in bounds and is mine
-                if 0 <= i < self.height and 0 <= j < self.width:
-                    if self.board[i][j]:
-                        count += 1
-
-        return count
+        i, j = cell
+        return self.counts[i * self.width + j]
 
     def won(self):
         """
@@ -142,11 +187,12 @@ class MinesweeperAI():
     Minesweeper game player
     """
 
-    def __init__(self, height=8, width=8):
+    def __init__(self, height=8, width=8, mines=None):
 
-        # Set initial height and width
+        # Set initial height and width, and the number of mines if known
         self.height = height
         self.width = width
+        self.mine_count = mines
 
         # Keep track of which cells have been clicked on
         self.moves_made = set()
@@ -155,8 +201,45 @@ class MinesweeperAI():
         self.mines = set()
         self.safes = set()
 
-        # List of sentences about the game known to be true
-        self.knowledge = []
+        # Safe cells not yet clicked on
+        self.safe_moves = set()
+
+        # Sentences about the game known to be true, by their cells,
+        # and the cells of the sentences that contain each cell
+        self.knowledge = {}
+        self.containing = {}
+
+        # Cells of the sentences whose conclusions are yet to be drawn
+        self.pending = set()
+
+        # Mine arrangements of the current frontier components
+        self.arrangements_cache = {}
+
+    def add_sentence(self, cells, count):
+        """
+        Adds a sentence to the knowledge base, unless it has no cells
+        or is already known, and queues it for inference.
+        """
+        cells = frozenset(cells)
+        if not cells or cells in self.knowledge:
+            return
+        self.knowledge[cells] = Sentence(cells, count)
+        for cell in cells:
+            self.containing.setdefault(cell, set()).add(cells)
+        self.pending.add(cells)
+
+    def remove_sentence(self, cells):
+        """
+        Removes the sentence about cells from the knowledge base,
+        and returns it.
+        """
+        sentence = self.knowledge.pop(cells)
+        for cell in cells:
+            others = self.containing[cell]
+            others.discard(cells)
+            if not others:
+                del self.containing[cell]
+        return sentence
 
     def mark_mine(self, cell):
         """
@@ -164,8 +247,10 @@ class MinesweeperAI():
         to mark that cell as a mine as well.
         """
         self.mines.add(cell)
-        for sentence in self.knowledge:
+        for cells in list(self.containing.get(cell, ())):
+            sentence = self.remove_sentence(cells)
             sentence.mark_mine(cell)
+            self.add_sentence(sentence.cells, sentence.count)
 
     def mark_safe(self, cell):
         """
@@ -173,22 +258,25 @@ class MinesweeperAI():
         to mark that cell as safe as well.
         """
         self.safes.add(cell)
-        for sentence in self.knowledge:
+        if cell not in self.moves_made:
+            self.safe_moves.add(cell)
+        for cells in list(self.containing.get(cell, ())):
+            sentence = self.remove_sentence(cells)
             sentence.mark_safe(cell)
+            self.add_sentence(sentence.cells, sentence.count)
+
+    def neighbors(self, cell):
+        """
+        Returns the list of cells around cell, from the precomputed
+        offsets for its row and column.
+        """
+        i, j = cell
+        offsets = OFFSETS[edge_kind(i, self.height)][edge_kind(j, self.width)]
+        return [(i + di, j + dj) for di, dj in offsets]
 
     def _generate_neighbors(self, cell):
-        ci, cj = cell
-        r1 = max(0, ci-1) 
-        r2 = min(self.height, ci+2) 
-        c1 = max(0, cj-1) 
-        c2 = min(self.width, cj+2) 
-        ns = set() 
-        for i in range(r1, r2): 
-            for j in range(c1, c2): 
-                if ((i, j) != cell  #  and (i, j) not in self.mines
-                    and (i, j) not in self.moves_made): 
-                    ns.add((i, j)) 
-        return ns 
+        return [neighbor for neighbor in self.neighbors(cell)
+                if neighbor not in self.moves_made]
 
     def add_knowledge(self, cell, count):
         """
@@ -206,42 +294,60 @@ class MinesweeperAI():
                if they can be inferred from existing knowledge
         """
         self.moves_made.add(cell)
+        self.safe_moves.discard(cell)
         self.mark_safe(cell)
-        self.knowledge.append(Sentence(self._generate_neighbors(cell), count))
 
-        for sentence in self.knowledge:
+        # Leave cells already known to be safe or mines out
+        cells = set()
+        for neighbor in self._generate_neighbors(cell):
+            if neighbor in self.mines:
+                count -= 1
+            elif neighbor not in self.safes:
+                cells.add(neighbor)
+        self.add_sentence(cells, count)
+        self.infer()
+
+    def infer(self):
+        """
+        Draws conclusions from pending sentences until nothing new
+        follows. Marking cells and splitting sentences queues only
+        the sentences they change, and a sentence is compared only
+        with the sentences sharing one of its cells.
+        """
+        while self.pending:
+            cells = self.pending.pop()
+            sentence = self.knowledge.get(cells)
+            if sentence is None:
+                continue
+
             safes = sentence.known_safes()
+            mines = sentence.known_mines()
             for safe in safes:
                 self.mark_safe(safe)
-
-        for sentence in self.knowledge:
-            mines = sentence.known_mines()
             for mine in mines:
                 self.mark_mine(mine)
-
-        for i, s1 in enumerate(self.knowledge):
-            for j, s2 in enumerate(self.knowledge):
-                if i >= j:
+            if safes or mines:
+                continue
+
+            # If one sentence's cells are a subset of another's, the
+            # other's remaining cells hold the difference of counts
+            related = set()
+            for cell in cells:
+                related |= self.containing[cell]
+            related.discard(cells)
+            for other in related:
+                if other not in self.knowledge:
                     continue
-
-                if s1.cells.issubset(s2.cells):
-                    s2.cells = s2.cells - s1.cells
-                    s2.count = max(0, s2.count - s1.count)
-
-                elif s2.cells.issubset(s1.cells):
-                    s1.cells = s1.cells - s2.cells
-                    s1.count = max(0, s1.count - s2.count)
-                
-        for sentence in self.knowledge:
-            if len(sentence.cells) == 0:
-                self.knowledge.remove(sentence)
-                        
-        print("safes:", [c for c in self.safes if c not in self.moves_made])
-        print("mines:", self.mines)
-        print("knowledge:")
-        for sentence in self.knowledge:
-            print(str(sentence))
-        
+                if cells < other:
+                    count = self.remove_sentence(other).count
+                    self.add_sentence(other - cells,
+                                      max(0, count - sentence.count))
+                elif other < cells:
+                    count = self.knowledge[other].count
+                    self.remove_sentence(cells)
+                    self.add_sentence(cells - other,
+                                      max(0, sentence.count - count))
+                    break
 
     def make_safe_move(self):
         """
@@ -252,10 +358,9 @@ class MinesweeperAI():
         This function may use the knowledge in self.mines, self.safes
         and self.moves_made, but should not modify any of those values.
         """
-        for safe in self.safes:
-            if safe not in self.moves_made:
-                print("safe move:", safe)
-                return safe
+        for safe in self.safe_moves:
+            print("safe move:", safe)
+            return safe
         return None
 
     def make_random_move(self):
@@ -265,13 +370,242 @@ class MinesweeperAI():
             1) have not already been chosen, and
             2) are not known to be mines
         """
-        choices = list({
-            (i, j) for i in range(self.height) for j in range(self.width)
-        } - self.moves_made - self.mines)
+        cell = self.random_cell(lambda cell: (
+            cell not in self.moves_made and cell not in self.mines))
+        if cell is None:
+            return None
+        print("random move:", cell)
+        return cell
 
+    def random_cell(self, allowed):
+        """
+        Returns a random cell for which allowed(cell) is True, or None
+        if there is none. Tries random cells first, so that it only
+        lists the whole board when few cells are allowed.
+        """
+        for _ in range(SAMPLES):
+            cell = (random.randrange(self.height),
+                    random.randrange(self.width))
+            if allowed(cell):
+                return cell
+        choices = [(i, j) for i in range(self.height)
+                   for j in range(self.width) if allowed((i, j))]
         if not choices:
             return None
+        return random.choice(choices)
 
-        cell = random.choice(choices)
-        print("random move:", cell)
-        return cell
+    def components(self):
+        """
+        Splits the frontier, the unknown cells in some sentence, into
+        independent components: cells are in the same component if a
+        chain of sentences links them.
+
+        Returns a list of components, each a frozenset of the
+        (cells, count) pairs of its sentences.
+        """
+        components = []
+        seen = set()
+        for start in self.containing:
+            if start in seen:
+                continue
+            seen.add(start)
+            queue = [start]
+            sentences = set()
+            while queue:
+                cell = queue.pop()
+                for cells in self.containing[cell]:
+                    if cells in sentences:
+                        continue
+                    sentences.add(cells)
+                    for other in cells:
+                        if other not in seen:
+                            seen.add(other)
+                            queue.append(other)
+            components.append(frozenset(
+                (cells, self.knowledge[cells].count) for cells in sentences))
+        return components
+
+    def arrangements(self, component):
+        """
+        Enumerates the mine arrangements consistent with the sentences
+        of a component.
+
+        Returns (cells, counts), where counts maps each number k of
+        mines to [number of arrangements with k mines, list of how
+        many of those have a mine in each cell].
+        """
+        # Number cells so that cells of a sentence are close together
+        cells = []
+        index = {}
+        sentences = sorted(component, key=lambda s: (len(s[0]), sorted(s[0])))
+        for sentence_cells, _ in sentences:
+            for cell in sorted(sentence_cells):
+                if cell not in index:
+                    index[cell] = len(cells)
+                    cells.append(cell)
+
+        need = [count for _, count in sentences]
+        unassigned = [len(sentence_cells) for sentence_cells, _ in sentences]
+        assigned = [0] * len(sentences)
+        of_cell = [[] for _ in cells]
+        for s, (sentence_cells, _) in enumerate(sentences):
+            for cell in sentence_cells:
+                of_cell[index[cell]].append(s)
+
+        counts = {}
+        mines = [0] * len(cells)
+
+        def search(i, k):
+            if i == len(cells):
+                entry = counts.setdefault(k, [0, [0] * len(cells)])
+                entry[0] += 1
+                for j in range(len(cells)):
+                    entry[1][j] += mines[j]
+                return
+            for value in (0, 1):
+                consistent = True
+                for s in of_cell[i]:
+                    unassigned[s] -= 1
+                    assigned[s] += value
+                    if not (assigned[s] <= need[s]
+                            <= assigned[s] + unassigned[s]):
+                        consistent = False
+                if consistent:
+                    mines[i] = value
+                    search(i + 1, k + value)
+                for s in of_cell[i]:
+                    unassigned[s] += 1
+                    assigned[s] -= value
+            mines[i] = 0
+
+        search(0, 0)
+        return cells, counts
+
+    def mine_probabilities(self):
+        """
+        Returns (probabilities, interior): the probability that each
+        frontier cell is a mine, and that an unknown cell outside the
+        frontier is, or None if there are no such cells.
+
+        Components are enumerated exactly, reusing the arrangements
+        of components unchanged since the last call. If the number
+        of mines is known, arrangements are weighted by the ways of
+        placing the remaining mines outside the frontier: exactly
+        when there are few components, and otherwise by the odds of
+        a mine at the board's remaining mine density. Cells of
+        components too large to enumerate get the highest density
+        of their sentences instead.
+        """
+        probabilities = {}
+        exact = []
+        cache = {}
+        for component in self.components():
+            cells = set().union(*(sentence[0] for sentence in component))
+            if len(cells) > COMPONENT_LIMIT:
+                for cell in cells:
+                    probabilities[cell] = max(
+                        self.knowledge[sentence].count / len(sentence)
+                        for sentence in self.containing[cell])
+                continue
+            if component in self.arrangements_cache:
+                cache[component] = self.arrangements_cache[component]
+            else:
+                cache[component] = self.arrangements(component)
+            exact.append(cache[component])
+        self.arrangements_cache = cache
+
+        unknown = (self.height * self.width
+                   - len(self.safes) - len(self.mines))
+        outside = unknown - len(self.containing)
+        if self.mine_count is None:
+            left = None
+        else:
+            left = self.mine_count - len(self.mines)
+
+        weights = None
+        if left is not None and len(exact) <= EXACT_COMPONENTS:
+            weights = self.exact_weights(exact, left, outside)
+        if weights is None:
+            # Weigh each component on its own, k mines by odds ** k
+            odds = 1
+            if left is not None and 0 < left < unknown:
+                odds = left / (unknown - left)
+            weights = [{k: odds ** k for k in counts}
+                       for _, counts in exact]
+
+        expected = 0
+        for (cells, counts), weight in zip(exact, weights):
+            total = sum(entry[0] * weight[k] for k, entry in counts.items())
+            for j, cell in enumerate(cells):
+                probabilities[cell] = sum(
+                    entry[1][j] * weight[k]
+                    for k, entry in counts.items()) / total
+                expected += probabilities[cell]
+
+        if outside <= 0:
+            interior = None
+        elif left is not None:
+            interior = min(1, max(0, (left - expected) / outside))
+        elif probabilities:
+            interior = sum(probabilities.values()) / len(probabilities)
+        else:
+            interior = 0.5
+        return probabilities, interior
+
+    def exact_weights(self, exact, left, outside):
+        """
+        Returns, for each (cells, counts) component in exact, a dict
+        weighing its arrangements with k mines by the ways of placing
+        the left mines in the other components and the outside cells,
+        or None if no placement is consistent.
+        """
+        def convolve(a, b):
+            c = {}
+            for i, x in a.items():
+                for j, y in b.items():
+                    c[i + j] = c.get(i + j, 0) + x * y
+            return c
+
+        def placements(s):
+            if 0 <= left - s <= outside:
+                return math.comb(outside, left - s)
+            return 0
+
+        # Numbers of arrangements by number of mines, over all the
+        # components before and after each component
+        distributions = [{k: entry[0] for k, entry in counts.items()}
+                         for _, counts in exact]
+        before = [{0: 1}]
+        for distribution in distributions:
+            before.append(convolve(before[-1], distribution))
+        after = [{0: 1}]
+        for distribution in reversed(distributions):
+            after.append(convolve(distribution, after[-1]))
+        after.reverse()
+
+        if not any(ways * placements(s) for s, ways in before[-1].items()):
+            return None
+        weights = []
+        for c, (_, counts) in enumerate(exact):
+            others = convolve(before[c], after[c + 1])
+            weights.append({
+                k: sum(ways * placements(k + s) for s, ways in others.items())
+                for k in counts})
+        return weights
+
+    def make_best_guess(self):
+        """
+        Returns the unknown cell least likely to be a mine, to play
+        when no safe move is known, or None if no move is left.
+        """
+        probabilities, interior = self.mine_probabilities()
+        best = min(probabilities, key=probabilities.get, default=None)
+        if interior is not None and (
+                best is None or interior < probabilities[best]):
+            best = self.random_cell(
+                lambda cell: cell not in self.safes
+                and cell not in self.mines
+                and cell not in self.containing)
+        if best is not None:
+            print("best guess:", best)
+        return best